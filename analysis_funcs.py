@@ -15,6 +15,7 @@ except ModuleNotFoundError:
 import os
 import pickle
 from pdb import set_trace
+from utils import load_pickle
 
 def plot_smoothed_loss(mons, filter_size=100):
     
@@ -128,8 +129,7 @@ def plot_results_from_job(job_name, rnn_signals, colors,
         if int(file_name.split('_')[-1])>n_seeds:
             continue
         
-        with open(os.path.join(data_dir, file_name), 'rb') as f:
-            result = pickle.load(f)
+        result = load_pickle(os.path.join(data_dir, file_name))
             
         for key, col in zip(rnn_signals, rnn_colors):
             
@@ -6,13 +6,11 @@ Created on Mon Mar 23 15:42:06 2020
 @author: omarschall
 """
 
-with open('notebooks/good_ones/current_fave', 'rb') as f:
-    sim = pickle.load(f)
+sim = load_pickle('notebooks/good_ones/current_fave')
     
-# with open('/Users/omarschall/cluster_results/vanilla-rtrl/rflo_bptt/result_0', 'rb') as f:
-#     result = pickle.load(f)
-#     sim = result['sim']
-#     rnn = sim.rnn
+# result = load_pickle('/Users/omarschall/cluster_results/vanilla-rtrl/rflo_bptt/result_0')
+# sim = result['sim']
+# rnn = sim.rnn
 
 sim.resume_sim_at_checkpoint(data, i_checkpoint=params['segment'], N=1000,
                              checkpoint_interval=50)
@@ -224,8 +222,7 @@ if os.environ['HOME'] == '/Users/omarschall':
 
     #np.random.seed(1)
 
-#with open('notebooks/good_ones/another_try', 'rb') as f:
-#    sim = pickle.load(f)
+#sim = load_pickle('notebooks/good_ones/another_try')
 #
 #sim.checkpoint_model()
 #
@@ -350,8 +347,7 @@ processed_data = {'test_loss': test_loss}
 
 # Load network
 network_name = 'j_boxman'
-with open(os.path.join('notebooks/good_ones', network_name), 'rb') as f:
-    rnn = pickle.load(f)
+rnn = load_pickle(os.path.join('notebooks/good_ones', network_name))
 
 task = Flip_Flop_Task(3, 0.05)
 np.random.seed(0)
@@ -401,10 +397,9 @@ all_speeds = []
 
 for i_job in range(30):
     try:
-        with open(os.path.join(data_path, 'result_{}'.format(i_job)), 'rb') as f:
-            result = pickle.load(f)
-            A = result['A']
-            all_speeds.append(result['speeds'][-1])
+        result = load_pickle(os.path.join(data_path, 'result_{}'.format(i_job)))
+        A = result['A']
+        all_speeds.append(result['speeds'][-1])
     except FileNotFoundError:
         continue
     for i in range(20):
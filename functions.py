@@ -17,13 +17,21 @@ class Function:
             argument for a label, e.g. for softmax-cross-entropy.
         f_prime (function): The element-wise derivative of f with respect to
             the first argument, must also act on 1-d numpy arrays of arbitrary
-            dimension."""
+            dimension.
+        f_and_f_prime (function or None): Optional function returning the
+            tuple (f, f_prime) in one pass, for losses whose value and
+            derivative share intermediate results."""
 
-    def __init__(self, f, f_prime):
-        """Inits an instance of Function by specifying f and f_prime."""
+    #Default for instances pickled before f_and_f_prime existed
+    f_and_f_prime = None
+
+    def __init__(self, f, f_prime, f_and_f_prime=None):
+        """Inits an instance of Function by specifying f and f_prime, and
+        optionally f_and_f_prime."""
 
         self.f = f
         self.f_prime = f_prime
+        self.f_and_f_prime = f_and_f_prime
 
 ### --- Define sigmoid --- ###
 
@@ -113,8 +121,15 @@ def softmax_cross_entropy_derivative(z, y):
 
     return softmax_(z) - y
 
+def softmax_cross_entropy_and_derivative(z, y, epsilon=0.0001):
+
+    p = softmax_(z)
+
+    return -y.dot(np.log(np.maximum(p, epsilon))), p - y
+
 softmax_cross_entropy = Function(softmax_cross_entropy_,
-                                 softmax_cross_entropy_derivative)
+                                 softmax_cross_entropy_derivative,
+                                 softmax_cross_entropy_and_derivative)
 
 ### --- Define softplus --- ###
 
@@ -152,8 +167,15 @@ def mean_squared_error_derivative(z, y):
 
     return z - y
 
+def mean_squared_error_and_derivative(z, y):
+
+    error = z - y
+
+    return 0.5*np.square(error).mean(), error
+
 mean_squared_error = Function(mean_squared_error_,
-                              mean_squared_error_derivative)
+                              mean_squared_error_derivative,
+                              mean_squared_error_and_derivative)
 
 
 
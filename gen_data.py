@@ -8,6 +8,36 @@ Created on Mon Sep 10 16:30:03 2018
 
 import numpy as np
 import pickle
+import hashlib
+import os
+
+def encode_config_value(value):
+    """Encodes an attribute of a task for its cache key, so that different
+    values give different encodings.
+
+    Scalars (including numpy scalars) and strings are kept as they are,
+    lists, tuples and dicts are encoded item by item, and numpy arrays by
+    their dtype, shape and a hash of their data.
+
+    Raises:
+        TypeError: If value (or any item of it) is of another type."""
+
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, (int, float, complex, str, bytes, bool, type(None))):
+        return value
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__,
+                tuple(encode_config_value(v) for v in value))
+    if isinstance(value, dict):
+        return ('dict', tuple(sorted((repr(k), encode_config_value(v))
+                                     for k, v in value.items())))
+    if isinstance(value, np.ndarray):
+        data = np.ascontiguousarray(value).tobytes()
+        return ('ndarray', value.dtype.str, value.shape,
+                hashlib.sha1(data).hexdigest())
+    raise TypeError('Cannot encode task attribute of type '
+                    + type(value).__name__ + ' for the cache key')
 
 class Task:
     """Parent class for all tasks. A Task is a class whose instances generate
@@ -19,6 +49,9 @@ class Task:
     arrays with shapes (time_steps, n_in) and (time_steps, n_out),
     respectively."""
 
+    #Attributes left out of get_config (e.g. encoded there by a subclass)
+    config_ignore = []
+
     def __init__(self, n_in, n_out):
         """Initializes a Task with the number of input and output dimensions
 
@@ -29,22 +62,104 @@ class Task:
         self.n_in = n_in
         self.n_out = n_out
 
-    def gen_data(self, N_train, N_test):
+    def gen_data(self, N_train, N_test, cache_dir=None):
         """Generates a data dict with a given number of train and test examples.
 
+        If cache_dir is specified, the data are stored there the first time
+        they are generated, as .npy files named by a hash of the task config,
+        the number of examples, and the state of np.random. Any later call
+        with the same key (e.g. from another job of a sweep) memory-maps the
+        files instead of generating the data again, and leaves np.random in
+        the same state as generating would have. Data are not cached for a
+        task whose config cannot be encoded (see get_config).
+
         Args:
             N_train (int): number of training examples
             N_test (int): number of testing examples
+            cache_dir (str): Optional path of a directory for cached data.
         Returns:
             data (dict): Dictionary pointing to 2 sub-dictionaries 'train'
                 and 'test', each of which has keys 'X' and 'Y' for inputs
                 and labels, respectively."""
 
+        if cache_dir is not None:
+            try:
+                key = self.get_cache_key(N_train, N_test)
+            except TypeError:
+                #The config cannot be fully encoded, so do not risk sharing
+                #cached data with a different task
+                cache_dir = None
+        if cache_dir is not None:
+            cache_path = os.path.join(cache_dir, key)
+            if os.path.exists(cache_path):
+                return self.load_cached_data(cache_path)
+
         data = {'train': {}, 'test': {}}
 
         data['train']['X'], data['train']['Y'] = self.gen_dataset(N_train)
         data['test']['X'], data['test']['Y'] = self.gen_dataset(N_test)
 
+        if cache_dir is not None:
+            self.save_cached_data(data, cache_path)
+
+        return data
+
+    def get_config(self):
+        """Returns a dict of the attributes that determine the generated data,
+        used for the cache key in gen_data. By default this is every attribute
+        not in config_ignore, encoded by encode_config_value.
+
+        Raises:
+            TypeError: If an attribute cannot be encoded."""
+
+        return {k: encode_config_value(v) for k, v in self.__dict__.items()
+                if k not in self.config_ignore}
+
+    def get_cache_key(self, N_train, N_test):
+        """Returns a hash of the task class and config, the number of examples,
+        and the current state of np.random."""
+
+        config = sorted(self.get_config().items())
+        key = (self.__class__.__name__, config, N_train, N_test,
+               np.random.get_state())
+
+        return hashlib.sha1(pickle.dumps(key)).hexdigest()
+
+    def save_cached_data(self, data, cache_path):
+        """Saves a data dict, along with the state of np.random after
+        generating it, to the directory cache_path. The files are written to
+        a temporary directory first and then renamed, so that concurrent jobs
+        never load a partially written cache."""
+
+        tmp_path = '{}.{}.tmp'.format(cache_path, os.getpid())
+        os.makedirs(tmp_path, exist_ok=True)
+        for mode in ['train', 'test']:
+            for var in ['X', 'Y']:
+                np.save(os.path.join(tmp_path, '{}_{}.npy'.format(var, mode)),
+                        data[mode][var])
+        with open(os.path.join(tmp_path, 'random_state'), 'wb') as f:
+            pickle.dump(np.random.get_state(), f)
+
+        try:
+            os.rename(tmp_path, cache_path)
+        except OSError: #Another job saved the same data first
+            for file_name in os.listdir(tmp_path):
+                os.remove(os.path.join(tmp_path, file_name))
+            os.rmdir(tmp_path)
+
+    def load_cached_data(self, cache_path):
+        """Loads (read-only, memory-mapped) a data dict saved by
+        save_cached_data and restores the state of np.random."""
+
+        data = {'train': {}, 'test': {}}
+        for mode in ['train', 'test']:
+            for var in ['X', 'Y']:
+                file_path = os.path.join(cache_path,
+                                         '{}_{}.npy'.format(var, mode))
+                data[mode][var] = np.load(file_path, mmap_mode='r')
+        with open(os.path.join(cache_path, 'random_state'), 'rb') as f:
+            np.random.set_state(pickle.load(f))
+
         return data
 
     def gen_dataset(self, N):
@@ -123,6 +238,8 @@ class Mimic_RNN(Task):
     and the labels are the outputs of a fixed 'target' RNN that is fed these
     inputs."""
 
+    config_ignore = ['rnn']
+
     def __init__(self, rnn, p_input, tau_task=1, latent_dim=None):
         """Initializes the task with a target RNN (instance of network.RNN),
         the probability of the Bernoulli inputs, and a time constant of change.
@@ -143,6 +260,21 @@ class Mimic_RNN(Task):
         if self.latent_dim is not None:
             self.segment_length = self.n_in // self.latent_dim
 
+    def get_config(self):
+        """Adds the target RNN's alpha, functions and a hash of its parameters
+        to the task config, so that cached data are only reused for the same
+        target RNN."""
+
+        config = super().get_config()
+        params = b''.join(np.ascontiguousarray(p).tobytes()
+                          for p in self.rnn.params)
+        config['rnn_params'] = hashlib.sha1(params).hexdigest()
+        config['rnn_alpha'] = self.rnn.alpha
+        config['rnn_functions'] = (self.rnn.activation.f.__name__,
+                                   self.rnn.output.f.__name__)
+
+        return config
+
     def gen_dataset(self, N):
         """Generates a dataset by first generating inputs randomly by the
         binomial distribution and temporally stretching them by tau_task,
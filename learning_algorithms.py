@@ -97,7 +97,9 @@ class Learning_Algorithm:
 
         Updates q to the current value of dL/da."""
 
-        self.q_prev = np.copy(self.q)
+        #q is always rebound to a new array, never modified in place, so the
+        #previous value can be kept without a copy
+        self.q_prev = self.q
 
         if self.W_FB is None:
             self.q = self.rnn.error.dot(self.rnn.W_out)
@@ -162,14 +164,18 @@ class Learning_Algorithm:
         self.propagate_feedback_to_hidden()
         self.rec_grads = self.get_rec_grads()
         rec_grads_list = split_weight_matrix(self.rec_grads,
-                                             [self.n_h, self.n_in, 1])
+                                             (self.n_h, self.n_in, 1))
         outer_grads_list = split_weight_matrix(self.outer_grads,
-                                               [self.n_h, 1])
+                                               (self.n_h, 1))
         grads_list = rec_grads_list + outer_grads_list
 
         if self.L2_reg is not None:
             grads_list = self.L2_regularization(grads_list)
 
+        #Keep the parameters in the network's dtype after the optimizer step
+        dtype = self.rnn.W_rec.dtype
+        grads_list = [g.astype(dtype, copy=False) for g in grads_list]
+
         return grads_list
 
     def reset_learning(self):
@@ -212,12 +218,13 @@ class RTRL(Learning_Algorithm):
 
     where J is the network Jacobian and M_immediate is the immediate influence
     of a parameter w on the hidden state a. (See paper for more detailed
-    notation.) M_immediate is notated as papw in the code for "partial a partial
-    w." For a vanilla network, this can be simply (if inefficiently) computed as
-    the Kronecker product of a_hat = [a_prev, x, 1] (a concatenation of the prev
-    hidden state, the input, and a constant 1 (for bias)) with the activation
-    derivatives organized in a diagonal matrix. The implementation of Eq. (1)
-    is in the update_learning_vars method.
+    notation.) For a vanilla network, M_immediate is the Kronecker product of
+    a_hat = [a_prev, x, 1] (a concatenation of the prev hidden state, the
+    input, and a constant 1 (for bias)) with the activation derivatives D
+    organized in a diagonal matrix. Rather than forming this mostly-zero matrix,
+    we add the outer product of D and a_hat directly onto the entries of M where
+    the unit index matches the parameter's row index. The implementation of
+    Eq. (1) is in the update_learning_vars method.
 
     Finally, the algorithm returns recurrent gradients by projecting the
     feedback vector q onto the influence matrix M:
@@ -233,8 +240,11 @@ class RTRL(Learning_Algorithm):
         allowed_kwargs_ = set() #No special kwargs for RTRL
         super().__init__(rnn, allowed_kwargs_, **kwargs)
 
-        #Initialize influence matrix
-        self.dadw = np.zeros((self.n_h, self.rnn.n_h_params))
+        #Initialize influence matrix, and a second buffer of the same shape
+        #that the product JM is written into before the two are swapped
+        self.dadw = np.zeros((self.n_h, self.rnn.n_h_params),
+                             dtype=self.rnn.W_rec.dtype)
+        self.dadw_buffer = np.zeros_like(self.dadw)
         self.M_decay = M_decay
 
     def update_learning_vars(self):
@@ -243,18 +253,27 @@ class RTRL(Learning_Algorithm):
         #Get relevant values and derivatives from network.
         self.a_hat = np.concatenate([self.rnn.a_prev,
                                      self.rnn.x,
-                                     np.array([1])])
-        D = np.diag(self.rnn.activation.f_prime(self.rnn.h))
-        self.papw = np.kron(self.a_hat, D) #Calculate M_immediate
+                                     np.ones(1, dtype=self.dadw.dtype)])
+        self.D = self.rnn.get_D()
         self.rnn.get_a_jacobian() #Get updated network Jacobian
 
-        #Update influence matrix via Eq. (1).
-        self.dadw = self.M_decay * self.rnn.a_J.dot(self.dadw) + self.papw
+        #Update influence matrix via Eq. (1), adding M_immediate in factored
+        #form through a (n_h, m, n_h) view of dadw, where dadw_tensor[k, j, i]
+        #is the influence of W_{ij} on a_k.
+        np.dot(self.rnn.a_J, self.dadw, out=self.dadw_buffer)
+        self.dadw, self.dadw_buffer = self.dadw_buffer, self.dadw
+        if self.M_decay != 1:
+            self.dadw *= self.M_decay
+        dadw_tensor = self.dadw.reshape((self.n_h, self.m, self.n_h))
+        i_h = np.arange(self.n_h)
+        dadw_tensor[i_h, :, i_h] += np.multiply.outer(self.D, self.a_hat)
 
     def get_rec_grads(self):
         """Calculates recurrent grads using Eq. (2), reshapes into original
         matrix form."""
 
+        #dadw is in column (Fortran) order over w, so the Fortran-order
+        #reshape of the 1-d product is a view rather than a copy
         return self.q.dot(self.dadw).reshape((self.n_h, self.m), order='F')
 
     def reset_learning(self):
@@ -264,17 +283,74 @@ class RTRL(Learning_Algorithm):
 
 class Stochastic_Algorithm(Learning_Algorithm):
 
+    #Number of samples of nu drawn at once, by default enough to fill
+    #nu_batch_elements entries
+    nu_batch_size = None
+    nu_batch_elements = 2**15
+
     def sample_nu(self):
-        """Sample nu from specified distribution."""
+        """Sample nu from specified distribution.
+
+        Samples are drawn a batch at a time from a numpy Generator and handed
+        out one per call. The Generator is seeded from np.random on first use,
+        so np.random.seed still makes runs reproducible. The batch itself is
+        not kept in copies or pickles (see __getstate__): it is redrawn from
+        the Generator state it was drawn from, so the samples continue
+        exactly."""
+
+        if getattr(self, 'nu_rng', None) is None:
+            self.nu_rng = np.random.default_rng(np.random.randint(2**31))
+            self.i_nu = None
+        n_batch = (self.nu_batch_size or
+                   max(self.nu_batch_elements // self.n_nu, 1))
+        if self.i_nu is None or self.i_nu == n_batch:
+            self.draw_nu_batch(n_batch)
+            self.i_nu = 0
+        elif getattr(self, 'nu_batch', None) is None:
+            self.nu_rng.bit_generator.state = self.nu_batch_rng_state
+            self.draw_nu_batch(n_batch)
+
+        nu = self.nu_batch[self.i_nu]
+        self.i_nu += 1
+
+        return nu
+
+    def draw_nu_batch(self, n_batch):
+        """Draws a new batch of n_batch samples of nu, remembering the
+        Generator state it was drawn from."""
+
+        self.nu_batch_rng_state = self.nu_rng.bit_generator.state
+        self.nu_batch = self.sample_nu_batch(n_batch)
 
+    def __getstate__(self):
+        """Leaves the batch of samples of nu out of pickles."""
+
+        state = self.__dict__.copy()
+        state.pop('nu_batch', None)
+        return state
+
+    def __deepcopy__(self, memo):
+        """Leaves the batch of samples of nu out of deep copies (e.g. in
+        checkpoints)."""
+
+        alg = self.__class__.__new__(self.__class__)
+        memo[id(self)] = alg
+        alg.__dict__.update(deepcopy(self.__getstate__(), memo))
+        return alg
+
+    def sample_nu_batch(self, n_batch):
+        """Samples an array of shape (n_batch, n_nu) from the specified
+        distribution."""
+
+        size = (n_batch, self.n_nu)
         if self.nu_dist == 'discrete' or self.nu_dist is None:
-            nu = np.random.choice([-1, 1], self.n_nu)
+            nu_batch = 2 * self.nu_rng.integers(0, 2, size) - 1
         elif self.nu_dist == 'gaussian':
-            nu = np.random.normal(0, 1, self.n_nu)
+            nu_batch = self.nu_rng.standard_normal(size)
         elif self.nu_dist == 'uniform':
-            nu = np.random.uniform(-1, 1, self.n_nu)
+            nu_batch = self.nu_rng.uniform(-1, 1, size)
 
-        return nu
+        return nu_batch
 
 class UORO(Stochastic_Algorithm):
     """Implements the Unbiased Online Recurrent Optimization (UORO) algorithm
@@ -346,7 +422,7 @@ class UORO(Stochastic_Algorithm):
         self.a_hat = np.concatenate([self.rnn.a_prev,
                                      self.rnn.x,
                                      np.array([1])])
-        D = self.rnn.activation.f_prime(self.rnn.h)
+        D = self.rnn.get_D()
         #Compact form of M_immediate
         self.papw = np.multiply.outer(D, self.a_hat)
         self.rnn.get_a_jacobian() #Get updated network Jacobian
@@ -495,7 +571,7 @@ class KF_RTRL(Stochastic_Algorithm):
         self.a_hat = np.concatenate([self.rnn.a_prev,
                                      self.rnn.x,
                                      np.array([1])])
-        self.D = np.diag(self.rnn.activation.f_prime(self.rnn.h))
+        self.D = np.diag(self.rnn.get_D())
         self.rnn.get_a_jacobian()
         self.B_forwards = self.rnn.a_J.dot(self.B)
 
@@ -528,10 +604,13 @@ class KF_RTRL(Stochastic_Algorithm):
         else:
             self.p1 = np.copy(self.P1)
 
-        #Update Kronecker product approximation
-        A = self.nu[0]*self.p0*self.A + self.nu[1]*self.p1*self.a_hat
-        B = (self.nu[0]*(1/self.p0)*self.B_forwards +
-             self.nu[1]*(1/self.p1)*self.D)
+        #Update Kronecker product approximation as a scaling plus an in-place
+        #axpy, adding the diagonal D only to the diagonal of B
+        A = np.multiply(self.A, self.nu[0]*self.p0)
+        A += (self.nu[1]*self.p1)*self.a_hat
+        B = np.multiply(self.B_forwards, self.nu[0]*(1/self.p0))
+        B.reshape(-1)[::self.n_h + 1] += ((self.nu[1]*(1/self.p1)) *
+                                          np.diagonal(self.D))
 
         return A, B
 
@@ -547,7 +626,8 @@ class KF_RTRL(Stochastic_Algorithm):
             An array of shape (n_h, m) representing the recurrent gradient."""
 
         self.qB = self.q.dot(self.B) #Unit-specific learning signal
-        return np.kron(self.A, self.qB).reshape((self.n_h, self.m), order='F')
+        #Equal to np.kron(A, qB) reshaped in Fortran order to (n_h, m)
+        return np.multiply.outer(self.qB, self.A)
 
     def reset_learning(self):
         """Resets learning by re-randomizing the outer product approximation to
@@ -620,7 +700,7 @@ class Reverse_KF_RTRL(Stochastic_Algorithm):
         self.a_hat = np.concatenate([self.rnn.a_prev,
                                      self.rnn.x,
                                      np.array([1])])
-        self.D = self.rnn.activation.f_prime(self.rnn.h)
+        self.D = self.rnn.get_D()
         #Compact form of M_immediate
         self.papw = np.multiply.outer(self.D, self.a_hat)
         self.rnn.get_a_jacobian() #Get updated network Jacobian
@@ -733,7 +813,7 @@ class RFLO(Learning_Algorithm):
         self.a_hat = np.concatenate([self.rnn.a_prev,
                                      self.rnn.x,
                                      np.array([1])])
-        self.D = self.rnn.activation.f_prime(self.rnn.h)
+        self.D = self.rnn.get_D()
         self.M_immediate = self.alpha * np.multiply.outer(self.D, self.a_hat)
 
         #Update eligibility traces
@@ -833,6 +913,10 @@ class DNI(Learning_Algorithm):
                                       (self.n_h, self.m_out))
         self.A_ = np.copy(self.A)
 
+        #Preallocated arrays for the outer products computed every time step
+        self.A_grad = np.zeros_like(self.A)
+        self.J_grad = np.zeros((self.n_h, self.n_h))
+
     def update_learning_vars(self):
         """Updates the A matrix by Eqs. (3) and (4)."""
 
@@ -856,7 +940,8 @@ class DNI(Learning_Algorithm):
 
         #Compute gradients for A
         self.scaled_A_error = self.A_error * self.activation.f_prime(self.sg_h)
-        self.A_grad = np.multiply.outer(self.scaled_A_error, self.a_tilde_prev)
+        np.multiply.outer(self.scaled_A_error, self.a_tilde_prev,
+                          out=self.A_grad)
 
         #Apply L2 regularization to A
         if self.SG_L2_reg > 0:
@@ -867,9 +952,11 @@ class DNI(Learning_Algorithm):
 
         #On interval determined by self.fix_A_interval, update A_, the values
         #used to calculate the target in Eq. (3), with the latest value of A.
+        #(A is rebound by the optimizer rather than modified in place, so
+        #A_ can share the array without a copy.)
         if self.i_fix == self.fix_A_interval - 1:
             self.i_fix = 0
-            self.A_ = np.copy(self.A)
+            self.A_ = self.A
         else:
             self.i_fix += 1
 
@@ -912,8 +999,9 @@ class DNI(Learning_Algorithm):
 
         self.J_error = self.J_approx.dot(self.rnn.a_prev) - self.rnn.a
         self.J_loss = 0.5 * np.square(self.J_error).mean()
-        self.J_approx -= self.J_lr * np.multiply.outer(self.J_error,
-                                                       self.rnn.a_prev)
+        np.multiply.outer(self.J_error, self.rnn.a_prev, out=self.J_grad)
+        self.J_grad *= self.J_lr
+        self.J_approx -= self.J_grad
 
     def synthetic_grad(self, a_tilde):
         """Computes the synthetic gradient using current values of A.
@@ -949,7 +1037,7 @@ class DNI(Learning_Algorithm):
         #Calculate synthetic gradient
         self.sg = self.synthetic_grad(self.a_tilde)
         #Combine the first 3 factors of the RHS of Eq. (2) into sg_scaled
-        D = self.rnn.activation.f_prime(self.rnn.h)
+        D = self.rnn.get_D()
         self.sg_scaled = self.sg * self.rnn.alpha * D
 
         self.a_hat = np.concatenate([self.rnn.a_prev,
@@ -992,7 +1080,7 @@ class Efficient_BPTT(Learning_Algorithm):
         self.a_hat_history.insert(0, np.concatenate([self.rnn.a_prev,
                                                      self.rnn.x,
                                                      np.array([1])]))
-        self.h_history.insert(0, self.rnn.h)
+        self.h_history.insert(0, np.copy(self.rnn.h))
         self.propagate_feedback_to_hidden()
         self.q_history.insert(0, self.q)
 
@@ -1082,7 +1170,7 @@ class Future_BPTT(Learning_Algorithm):
         self.a_hat_history.insert(0, np.concatenate([self.rnn.a_prev,
                                                      self.rnn.x,
                                                      np.array([1])]))
-        self.h_history.insert(0, self.rnn.h)
+        self.h_history.insert(0, np.copy(self.rnn.h))
         self.propagate_feedback_to_hidden()
         q = np.copy(self.q)
         #Add immediate credit assignment to front of list
@@ -1224,7 +1312,7 @@ class KeRNL(Learning_Algorithm):
         self.Omega = self.kernel * self.Omega + self.zeta
 
         #Update eligibility trace (Eq. 1)
-        self.D = self.rnn.activation.f_prime(self.rnn.h)
+        self.D = self.rnn.get_D()
         self.a_hat = np.concatenate([self.rnn.a_prev,
                                      self.rnn.x,
                                      np.array([1])])
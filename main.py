@@ -22,7 +22,6 @@ from itertools import product
 import os
 import pickle
 from copy import deepcopy
-from scipy.ndimage.filters import uniform_filter1d
 from sklearn import linear_model
 from state_space import *
 from dynamics import *
@@ -30,15 +29,21 @@ import multiprocessing as mp
 from functools import partial
 from sklearn.cluster import DBSCAN
 
+n_seeds = 1
+macro_configs = config_generator(i_start=list(range(0, 100000, 1000)),
+                                 algorithm=['E-BPTT', 'RFLO'])
+micro_configs = tuple(product(macro_configs, list(range(n_seeds))))
+
+#Defaults for other machines (e.g. to run a local sweep)
+i_job = 0
+params, i_seed = micro_configs[i_job]
+save_dir = os.environ.get('SAVEPATH', 'library')
+
 if os.environ['HOME'] == '/home/oem214':
-    n_seeds = 1
     try:
         i_job = int(os.environ['SLURM_ARRAY_TASK_ID']) - 1
     except KeyError:
         i_job = 0
-    macro_configs = config_generator(i_start=list(range(0, 100000, 1000)),
-                                     algorithm=['E-BPTT', 'RFLO'])
-    micro_configs = tuple(product(macro_configs, list(range(n_seeds))))
 
     params, i_seed = micro_configs[i_job]
     i_config = i_job//n_seeds
@@ -59,25 +64,107 @@ if os.environ['HOME'] == '/Users/omarschall':
 # task = Flip_Flop_Task(3, 0.05, tau_task=1)
 # N_train = 100
 # N_test = 10000
-# data = task.gen_data(N_train, N_test)
+# data = task.gen_data(N_train, N_test,
+#                      cache_dir=os.path.join(save_dir, 'data_cache'))
 # with open('notebooks/good_ones/{}_net'.format(params['algorithm']), 'rb') as f:
 #     sim = pickle.load(f)
     
 # sim.resume_sim_at_checkpoint(data, 99999, N=100001, checkpoint_interval=100)
 
-file_exists = True
-try:
-    with open('library/bptt_rflo/result_{}'.format(i_job), 'rb') as f:
-        result = pickle.load(f)
-except FileNotFoundError:
-    file_exists = False
-    
-if file_exists:
+def run_one(i_job, params):
+    """Runs the analysis for a single job of the sweep, indexed by i_job in
+    micro_configs, and returns its result (or None if the job has no saved
+    training result to analyze)."""
+
+    np.random.seed(i_job)
+
+    try:
+        result = load_pickle('library/bptt_rflo/result_{}'.format(i_job))
+    except FileNotFoundError:
+        return None
+
     for i_checkpoint in range(params['i_start'],
                               params['i_start'] + 1000, 100):
         get_graph_structure(result['checkpoint_{}'.format(i_checkpoint)],
                             N=100, time_steps=5, parallelize=False)
-    
+
+    result['i_job'] = i_job
+    result['config'] = params
+
+    return result
+
+def save_result(result, save_dir, asynchronous=True):
+    """Pickles a result from run_one into save_dir, by default in a
+    background thread so that the sweep can continue while the file is
+    written.
+
+    Args:
+        result (dict): A result returned by run_one.
+        save_dir (str): Directory to save the result in.
+        asynchronous (bool): Whether to write the file in the background.
+            The returned future must then be waited on, since any
+            exception from writing the file is only raised by its result()
+            method.
+    Returns:
+        A concurrent.futures.Future if asynchronous is True, else None."""
+
+    if not os.path.exists(save_dir):
+        os.mkdir(save_dir)
+    save_path = os.path.join(save_dir, 'result_'+str(result['i_job']))
+
+    if not asynchronous:
+        return save_pickle(result, save_path)
+    return save_pickle_async(result, save_path)
+
+def run_one_job(job):
+    """Runs run_one on an (i_job, params) pair, for Pool.imap_unordered."""
+
+    return run_one(*job)
+
+def run_sweep(save_dir, i_job=0):
+    """Runs every job of the sweep in micro_configs across local cores,
+    rather than one job per SLURM array task.
+
+    Each result is saved as soon as its job finishes, so that a crash only
+    loses the jobs still running, and then released, so that only one
+    result at a time (plus that of job i_job) is held in memory.
+
+    Args:
+        save_dir (str): Directory to save the results in.
+        i_job (int): Index of the job whose result is returned.
+    Returns:
+        The result of job i_job, or None if it has none."""
+
+    jobs = [(i, config[0]) for i, config in enumerate(micro_configs)]
+    kept_result = None
+    save = None
+    with mp.Pool(mp.cpu_count()) as pool:
+        for result in pool.imap_unordered(run_one_job, jobs):
+            if result is None:
+                continue
+            #Finish (and check) the previous save before queuing another
+            if save is not None:
+                save.result()
+            save = save_result(result, save_dir)
+            if result['i_job'] == i_job:
+                kept_result = result
+    if save is not None:
+        save.result()
+
+    return kept_result
+
+#Worker processes started by spawn (e.g. on macOS) import this module, so
+#jobs are only run, plotted and saved in the main process.
+result = None
+result_saved = False
+if __name__ == '__main__':
+    if os.environ.get('RUN_LOCAL_SWEEP'):
+        result = run_sweep(save_dir, i_job)
+        #Already saved with the rest of the sweep, so not saved again below
+        result_saved = result is not None
+    else:
+        result = run_one(i_job, params)
+file_exists = result is not None
 
 # result = {}
 # for i_checkpoint in range(params['i_start'], params['i_start'] + 1000, 100):
@@ -147,12 +234,12 @@ if file_exists:
 # with open('notebooks/good_ones/{}_net_prezzy'.format(params['algorithm']), 'wb') as f:
 #     pickle.dump(sim, f)
 
-if os.environ['HOME'] == '/Users/omarschall':
+if os.environ['HOME'] == '/Users/omarschall' and __name__ == '__main__':
 
     plt.figure()
     n_filter = 2000
-    filtered_loss = uniform_filter1d(sim.mons['rnn.loss_'], n_filter)
-    rec_grad_norms = uniform_filter1d(sim.mons['learn_alg.rec_grads-norm'], n_filter)
+    filtered_loss = moving_average(sim.mons['rnn.loss_'], n_filter)
+    rec_grad_norms = moving_average(sim.mons['learn_alg.rec_grads-norm'], n_filter)
     rec_grad_norms *= (np.amax(filtered_loss) / np.amax(rec_grad_norms))
     plt.plot(filtered_loss)
     plt.plot(rec_grad_norms)
@@ -182,45 +269,11 @@ if os.environ['HOME'] == '/Users/omarschall':
     plt.yticks([])
     plt.xlabel('time steps')
 
-if os.environ['HOME'] == '/home/oem214' and file_exists:
+if (os.environ['HOME'] == '/home/oem214' and __name__ == '__main__' and
+    file_exists and not result_saved):
 
     # result = {'sim': sim, 'i_seed': i_seed, 'task': task,
     #           'config': params, 'i_config': i_config, 'i_job': i_job,
     #           'processed_data': processed_data}
-    result['i_job'] = i_job
-    result['config'] = params
-    save_dir = os.environ['SAVEPATH']
-    if not os.path.exists(save_dir):
-        os.mkdir(save_dir)
-    save_path = os.path.join(save_dir, 'result_'+str(i_job))
-
-    with open(save_path, 'wb') as f:
-        pickle.dump(result, f)
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+    #Nothing runs after this save, so write it before the job exits
+    save_result(result, os.environ['SAVEPATH'], asynchronous=False)
@@ -9,6 +9,8 @@ Created on Fri Sep  7 17:20:39 2018
 import numpy as np
 from utils import *
 from functions import *
+from rnn_kernels import (forward_scan, get_activation_code,
+                         get_compiled_function)
 
 class RNN:
     """A vanilla recurrent neural network.
@@ -30,7 +32,8 @@ class RNN:
         b_rec (numpy array): Array of shape (n_h), represents the bias term
             in the recurrent update equation.
         params (list): The list of each parameter's current value, in the order
-            [W_rec, W_in, b_rec, W_out, b_out].
+            [W_rec, W_in, b_rec, W_out, b_out]. Built from the individual
+            attributes on access, and setting it sets them.
         shapes (list): The shape of each trainable set of parameters, in the
             same order.
         n_params (int): Number of total trainable parameters.
@@ -68,19 +71,29 @@ class RNN:
             previous time step.
         a_J (numpy array): Array of shape (n_h, n_h) representing the Jacobian
             of the network at current time, based on the equation (in TeX)
-            J_{ij} = \alpha\phi'(h_i) W_{rec,ij} + (1 - \alpha)\delta_{ij}."""
+            J_{ij} = \alpha\phi'(h_i) W_{rec,ij} + (1 - \alpha)\delta_{ij}.
+        D (numpy array): Array of shape (n_h) caching \phi'(h) for the current
+            h, computed by get_D.
+
+    All parameters and states share one floating point dtype (that of W_rec),
+    set by the dtype argument at initialization."""
 
     def __init__(self, W_in, W_rec, W_out, b_rec, b_out,
-                 activation, alpha, output, loss):
+                 activation, alpha, output, loss, dtype=np.float64):
         """Initializes an RNN by specifying its initial parameter values;
-        its activation, output, and loss functions; and alpha."""
+        its activation, output, and loss functions; and alpha.
+
+        The parameters are cast to dtype (without copying if they already have
+        it). Passing np.float32 halves the memory traffic of every matrix
+        product, including those of learning algorithms that allocate their
+        arrays in the network's dtype (e.g. the RTRL influence matrix)."""
 
         #Initial parameter values
-        self.W_in = W_in
-        self.W_rec = W_rec
-        self.W_out = W_out
-        self.b_rec = b_rec
-        self.b_out = b_out
+        self.W_in = W_in.astype(dtype, copy=False)
+        self.W_rec = W_rec.astype(dtype, copy=False)
+        self.W_out = W_out.astype(dtype, copy=False)
+        self.b_rec = b_rec.astype(dtype, copy=False)
+        self.b_out = b_out.astype(dtype, copy=False)
 
         #Network dimensions
         self.n_in = W_in.shape[1]
@@ -95,9 +108,7 @@ class RNN:
         assert self.n_h == b_rec.shape[0]
         assert self.n_out == b_out.shape[0]
 
-        #Define shapes and params lists for convenience later.
-        self.params = [self.W_rec, self.W_in, self.b_rec,
-                       self.W_out, self.b_out]
+        #Define shapes list for convenience later.
         self.shapes = [w.shape for w in self.params]
 
         #Activation and loss functions
@@ -120,6 +131,18 @@ class RNN:
         #Initial state values
         self.reset_network()
 
+    @property
+    def params(self):
+        """The list [W_rec, W_in, b_rec, W_out, b_out] of current parameters,
+        so that it never goes out of sync with the individual attributes."""
+
+        return [self.W_rec, self.W_in, self.b_rec, self.W_out, self.b_out]
+
+    @params.setter
+    def params(self, params):
+
+        self.W_rec, self.W_in, self.b_rec, self.W_out, self.b_out = params
+
     def reset_network(self, sigma=1, **kwargs):
         """Resets hidden state of the network, either randomly or by
         specifying with kwargs.
@@ -136,18 +159,20 @@ class RNN:
                 by h."""
 
         if 'h' in kwargs.keys(): #Manual reset if specified.
-            self.h = kwargs['h']
+            self.h = np.asarray(kwargs['h'], dtype=self.W_rec.dtype)
         else: #Random reset by sigma if not.
-            self.h = np.random.normal(0, sigma, self.n_h)
+            self.h = np.random.normal(0, sigma, self.n_h).astype(
+                self.W_rec.dtype, copy=False)
 
         self.a = self.activation.f(self.h) #Specify activations by \phi.
 
         if 'a' in kwargs.keys(): #Override with manual activations if given.
-            self.a = kwargs['a']
+            self.a = np.asarray(kwargs['a'], dtype=self.W_rec.dtype)
 
         self.z = self.W_out.dot(self.a) + self.b_out #Specify outputs from a
 
-    def next_state(self, x, a=None, update=True, sigma=0):
+    def next_state(self, x, a=None, update=True, sigma=0, noise=None,
+                   buffered=False):
         """Advances the network forward by one time step.
 
         Accepts as argument the current time step's input x and updates
@@ -164,38 +189,179 @@ class RNN:
                 provided only if update is False.
             sigma (float): Standard deviation of white noise added to pre-
                 activations before applying \phi.
+            noise (numpy array): Optional pre-drawn noise of shape (n_h), used
+                instead of drawing it here if sigma > 0 and update is True.
+                Should be distributed as sigma * N(0, alpha).
+            buffered (bool): If True and update is True, the new h and a are
+                written into preallocated buffers (see get_state_buffer)
+                rather than new arrays. This saves allocating them, but the
+                arrays self.h and self.a are then overwritten two time steps
+                later, so any caller keeping them for longer must copy them.
+                Used by Simulation, which copies what it records.
 
         Returns:
             Updates self.x, self.h, self.a, and self.*_prev, or returns the
             would-be update from given previous state a."""
 
+        x = np.asarray(x, dtype=self.W_rec.dtype)
+
         if update: #Update network if update is True
             self.x = x
-            self.h_prev = np.copy(self.h)
-            self.a_prev = np.copy(self.a)
-
-            self.h = (self.W_rec.dot(self.a) + self.W_in.dot(self.x) +
-                      self.b_rec) #Calculate new pre-activations
+            #The current state becomes the previous state without copying,
+            #and the new state is written into new arrays or buffers not
+            #holding it.
+            if buffered:
+                h = self.get_state_buffer('h')
+                a = self.get_state_buffer('a')
+            else:
+                h = np.empty(self.n_h, dtype=self.W_rec.dtype)
+                a = np.empty(self.n_h, dtype=self.W_rec.dtype)
+            self.h_prev, self.a_prev = self.h, self.a
+
+            #Calculate new pre-activations in place, using the free buffer a
+            #for the input drive before the new activations are written to it
+            np.dot(self.W_rec, self.a_prev, out=h)
+            h += np.dot(self.W_in, self.x, out=a)
+            h += self.b_rec
             if sigma>0: #Add noise to h if sigma is more than 0.
-                self.noise = sigma * np.random.normal(0, self.alpha, self.n_h)
+                if noise is None:
+                    noise = sigma * np.random.normal(0, self.alpha, self.n_h)
+                self.noise = noise.astype(self.W_rec.dtype, copy=False)
                 #self.h += self.noise
             else:
                 self.noise = 0
             #Implement recurrent update equation
-            self.a = ((1 - self.alpha)*self.a +
-                      self.alpha*self.activation.f(self.h)) + self.noise
+            phi = self.get_compiled_activation()[0]
+            np.multiply(phi(h), self.alpha, out=a)
+            a += (1 - self.alpha)*self.a_prev
+            if sigma>0:
+                a += self.noise
+            self.h, self.a = h, a
+            self.D_h = None #h changed in place, so get_D must recompute
         else: #Otherwise calculate would-be next state from provided input a.
             h = self.W_rec.dot(a) + self.W_in.dot(x) + self.b_rec
             if sigma > 0:
                 noise = np.random.normal(0, sigma, self.n_h)
-                h += noise
+                h += noise.astype(h.dtype, copy=False)
             return (1 - self.alpha)*a + self.alpha * self.activation.f(h)
 
-    def z_out(self):
-        """Update outputs using current state of the network."""
+    def get_compiled_activation(self):
+        """Returns the compiled activation.f and activation.f_prime (see
+        rnn_kernels.get_compiled_function).
+
+        They are looked up once and cached, and looked up again only if the
+        activation or the dtype of the network changes."""
+
+        key = (self.activation, self.W_rec.dtype)
+        if self.__dict__.get('compiled_activation_key') != key:
+            self.compiled_activation = (
+                get_compiled_function(self.activation.f),
+                get_compiled_function(self.activation.f_prime))
+            self.compiled_activation_key = key
+
+        return self.compiled_activation
+
+    def __getstate__(self):
+        """Leaves the cached compiled functions out of pickles and copies;
+        they are looked up again when first needed."""
+
+        state = self.__dict__.copy()
+        state.pop('compiled_activation', None)
+        state.pop('compiled_activation_key', None)
+
+        return state
+
+    def get_state_buffer(self, name):
+        """Returns one of two preallocated arrays for the state 'h', 'a' or
+        'z', whichever does not hold the current value of that state.
+
+        With buffered=True, next_state and z_out alternate between the two
+        buffers, so a state array is overwritten two time steps after it is
+        computed. Code that keeps a state for longer (e.g. a history for
+        BPTT) must copy it."""
 
-        self.z_prev = np.copy(self.z)
-        self.z = self.W_out.dot(self.a) + self.b_out
+        key = name + '_buffers'
+        if key not in self.__dict__:
+            n = self.n_out if name == 'z' else self.n_h
+            self.__dict__[key] = [np.empty(n, dtype=self.W_rec.dtype),
+                                  np.empty(n, dtype=self.W_rec.dtype)]
+        buffers = self.__dict__[key]
+
+        if getattr(self, name) is buffers[0]:
+            return buffers[1]
+        else:
+            return buffers[0]
+
+    def z_out(self, buffered=False):
+        """Update outputs using current state of the network.
+
+        Args:
+            buffered (bool): If True, the new z is written into a
+                preallocated buffer (see get_state_buffer) rather than a new
+                array, so self.z (and self.y_hat, for an identity output) is
+                overwritten two time steps later. See next_state."""
+
+        if buffered:
+            z = self.get_state_buffer('z')
+        else:
+            z = np.empty(self.n_out, dtype=self.W_rec.dtype)
+        self.z_prev = self.z
+        np.dot(self.W_out, self.a, out=z)
+        z += self.b_out
+        self.z = z
+
+    def run_forward(self, x_inputs):
+        """Runs the network forward (without noise) over a whole sequence of
+        inputs, leaving the network in its final state.
+
+        If the activation function is supported by rnn_kernels, the whole
+        time loop runs in one compiled kernel. Otherwise falls back to calling
+        next_state and z_out at each time step.
+
+        Args:
+            x_inputs (numpy array): Array of shape (T, n_in) of inputs.
+        Returns:
+            Arrays of shape (T, n_h), (T, n_h), and (T, n_out) containing the
+                values of h, a, and z at each time step."""
+
+        T = x_inputs.shape[0]
+        code = get_activation_code(self.activation)
+
+        if code is None:
+            H = np.zeros((T, self.n_h))
+            A = np.zeros((T, self.n_h))
+            Z = np.zeros((T, self.n_out))
+            for i_t in range(T):
+                self.next_state(x_inputs[i_t], buffered=True)
+                self.z_out(buffered=True)
+                H[i_t], A[i_t], Z[i_t] = self.h, self.a, self.z
+            return H, A, Z
+
+        X = np.ascontiguousarray(x_inputs, dtype=self.W_rec.dtype)
+        H, A, Z = forward_scan(X, np.array(self.a, dtype=self.W_rec.dtype),
+                               self.W_in, self.W_rec, self.b_rec,
+                               self.W_out, self.b_out,
+                               float(self.alpha), code)
+        self.set_final_state(x_inputs, H, A, Z)
+
+        return H, A, Z
+
+    def set_final_state(self, x_inputs, H, A, Z):
+        """Leaves the network in the state it would have after stepping
+        through x_inputs, given the states H, A and Z computed at each time
+        step by a compiled kernel."""
+
+        T = x_inputs.shape[0]
+        if T > 1:
+            self.h_prev, self.a_prev = H[-2].copy(), A[-2].copy()
+            self.z_prev = Z[-2].copy()
+        elif T == 1:
+            self.h_prev, self.a_prev = np.copy(self.h), np.copy(self.a)
+            self.z_prev = np.copy(self.z)
+        if T > 0:
+            self.x = x_inputs[-1]
+            self.h, self.a, self.z = H[-1].copy(), A[-1].copy(), Z[-1].copy()
+            self.noise = 0
 
     def get_a_jacobian(self, update=True, **kwargs):
         """Calculates the Jacobian of the network.
@@ -218,23 +384,39 @@ class RNN:
 
         #Use kwargs instead of defaults if provided
         if 'h' in kwargs.keys():
-            h = kwargs['h']
+            D = self.activation.f_prime(kwargs['h'])
         else:
-            h = np.copy(self.h)
+            D = self.get_D()
         if 'W_rec' in kwargs.keys():
             W_rec = kwargs['W_rec']
         else:
-            W_rec = np.copy(self.W_rec)
+            W_rec = self.W_rec
 
-        #Calculate Jacobian
-        D = np.diag(self.activation.f_prime(h)) #Nonlinearity derivative
-        a_J = self.alpha * D.dot(W_rec) + (1 - self.alpha) * np.eye(self.n_h)
+        #Calculate Jacobian, scaling rows of W_rec by nonlinearity derivative
+        a_J = (self.alpha * (D * W_rec.T).T +
+               (1 - self.alpha) * np.eye(self.n_h, dtype=W_rec.dtype))
 
         if update: #Update if update is True
-            self.a_J = np.copy(a_J)
+            self.a_J = a_J
         else: #Otherwise return
             return a_J
 
+    def get_D(self):
+        """Returns the derivative of the activation function at the current
+        pre-activations, \phi'(h).
+
+        The result is cached, so that the learning algorithm and the Jacobian
+        share one evaluation of activation.f_prime per time step. The cache is
+        tied to the h array it was computed from, so it is refreshed whenever h
+        is reassigned (e.g. by next_state or reset_network)."""
+
+        if getattr(self, 'D_h', None) is not self.h:
+            f_prime = self.get_compiled_activation()[1]
+            self.D = f_prime(self.h)
+            self.D_h = self.h
+
+        return self.D
+
     def get_network_speed(self, a=None):
         """Calculates and returns the (squared) 'speed' of the network given
         its current state and parameters. Option to specify a state value."""
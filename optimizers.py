@@ -40,6 +40,20 @@ class Optimizer:
         else:
             return grads
 
+    def update_params(self, params, grads):
+        """Updates each parameter in place, with the same rule as
+        get_updated_params. Child classes may override this to avoid
+        allocating new parameter arrays.
+
+        Args:
+            params (list): List of trainable parameters as numpy arrays,
+                which are modified.
+            grads (list): List of corresponding gradients as numpy arrays."""
+
+        updated_params = self.get_updated_params(params, grads)
+        for param, updated_param in zip(params, updated_params):
+            param[...] = updated_param
+
     def lr_decay(self):
         """Multiplicatively decays the learning rate by a factor of
         self.lr_decay_rate, with a floor learning rate of self.min_lr."""
@@ -157,6 +171,18 @@ class Stochastic_Gradient_Descent(Optimizer):
 
         return updated_params
 
+    def update_params(self, params, grads):
+        """Updates each parameter in place (see get_updated_params)."""
+
+        if self.lr_decay_rate is not None:
+            self.lr = self.lr_decay()
+
+        if self.clip_norm is not None:
+            self.clip_gradient(grads)
+
+        for param, grad in zip(params, grads):
+            param -= self.lr * grad
+
 class SGD_Momentum(Optimizer):
     """Impelements SGD with classical momentum."""
     
@@ -195,6 +221,24 @@ class SGD_Momentum(Optimizer):
             updated_params.append(param + v)
 
         return updated_params
+
+    def update_params(self, params, grads):
+        """Updates each parameter, and the velocities, in place (see
+        get_updated_params)."""
+
+        if self.lr_decay_rate is not None:
+            self.lr = self.lr_decay()
+
+        if self.clip_norm is not None:
+            self.clip_gradient(grads)
+
+        if self.vel is None:
+            self.vel = [np.zeros_like(g) for g in params]
+
+        for param, v, g in zip(params, self.vel, grads):
+            v *= self.mu
+            v -= self.lr * g
+            param += v
     
     
     
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compiled numeric kernels for running a vanilla RNN over a whole sequence, and
+compiled versions of the per-time-step functions in functions.py.
+
+If numba is available, the kernels are compiled to machine code the first
+time they are called (and cached on disk thereafter). Otherwise they run as
+ordinary Python functions with identical results.
+"""
+
+import numpy as np
+from functions import (tanh_, tanh_derivative, identity_, sigmoid_,
+                       sigmoid_derivative, softmax_, softmax_cross_entropy_,
+                       softmax_cross_entropy_derivative,
+                       softmax_cross_entropy_and_derivative,
+                       mean_squared_error_, mean_squared_error_and_derivative)
+try:
+    from numba import njit
+    COMPILED = True
+except ModuleNotFoundError:
+    COMPILED = False
+    def njit(*args, **kwargs):
+        """Stand-in for numba.njit that leaves the function uncompiled."""
+
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+#Integer codes for the activation functions supported by the kernels, keyed
+#by the underlying python function (which survives deepcopy of an RNN).
+ACTIVATION_CODES = {tanh_: 0, identity_: 1, sigmoid_: 2}
+
+#Integer codes for the supported (output, loss) pairs.
+LOSS_CODES = {(softmax_, softmax_cross_entropy_): 0,
+              (identity_, mean_squared_error_): 1}
+
+def get_activation_code(activation):
+    """Returns the kernel code for a functions.Function instance, or None if
+    the kernels do not support it."""
+
+    return ACTIVATION_CODES.get(activation.f)
+
+def get_loss_code(output, loss):
+    """Returns the kernel code for a pair of output and loss functions, or
+    None if the kernels do not support the pair."""
+
+    return LOSS_CODES.get((output.f, loss.f))
+
+### --- Compiled versions of functions.py --- ###
+
+@njit(cache=True)
+def tanh_kernel(z):
+    """Compiled functions.tanh_ for 1-d arrays."""
+
+    return np.tanh(z)
+
+@njit(cache=True)
+def tanh_derivative_kernel(z):
+    """Compiled functions.tanh_derivative for 1-d arrays, in one pass."""
+
+    out = np.empty_like(z)
+    for i in range(z.shape[0]):
+        t = np.tanh(z[i])
+        out[i] = 1 - t * t
+    return out
+
+@njit(cache=True)
+def sigmoid_kernel(z):
+    """Compiled functions.sigmoid_ for 1-d arrays."""
+
+    return 1 / (1 + np.exp(-z))
+
+@njit(cache=True)
+def sigmoid_derivative_kernel(z):
+    """Compiled functions.sigmoid_derivative for 1-d arrays, in one pass."""
+
+    out = np.empty_like(z)
+    for i in range(z.shape[0]):
+        s = 1 / (1 + np.exp(-z[i]))
+        out[i] = s * (1 - s)
+    return out
+
+@njit(cache=True)
+def softmax_kernel(z):
+    """Compiled functions.softmax_ for 1-d arrays."""
+
+    p = np.exp(z - np.max(z))
+    return p / np.sum(p)
+
+@njit(cache=True)
+def softmax_cross_entropy_kernel(z, y):
+    """Compiled functions.softmax_cross_entropy_ (with its default epsilon)
+    for 1-d arrays."""
+
+    p = softmax_kernel(z)
+    loss = 0.0
+    for i in range(p.shape[0]):
+        loss -= y[i] * np.log(max(p[i], 0.0001))
+    return loss
+
+@njit(cache=True)
+def softmax_cross_entropy_derivative_kernel(z, y):
+    """Compiled functions.softmax_cross_entropy_derivative for 1-d arrays."""
+
+    return softmax_kernel(z) - y
+
+@njit(cache=True)
+def softmax_cross_entropy_and_derivative_kernel(z, y):
+    """Compiled functions.softmax_cross_entropy_and_derivative (with its
+    default epsilon) for 1-d arrays."""
+
+    p = softmax_kernel(z)
+    loss = 0.0
+    for i in range(p.shape[0]):
+        loss -= y[i] * np.log(max(p[i], 0.0001))
+    return loss, p - y
+
+@njit(cache=True)
+def mean_squared_error_kernel(z, y):
+    """Compiled functions.mean_squared_error_ for 1-d arrays."""
+
+    loss = 0.0
+    for i in range(z.shape[0]):
+        loss += (z[i] - y[i]) ** 2
+    return 0.5 * loss / z.shape[0]
+
+@njit(cache=True)
+def mean_squared_error_and_derivative_kernel(z, y):
+    """Compiled functions.mean_squared_error_and_derivative for 1-d
+    arrays."""
+
+    error = z - y
+    loss = 0.0
+    for i in range(error.shape[0]):
+        loss += error[i] ** 2
+    return 0.5 * loss / error.shape[0], error
+
+#Compiled replacements for the python functions in functions.py
+COMPILED_FUNCTIONS = {tanh_: tanh_kernel,
+                      tanh_derivative: tanh_derivative_kernel,
+                      sigmoid_: sigmoid_kernel,
+                      sigmoid_derivative: sigmoid_derivative_kernel,
+                      softmax_: softmax_kernel,
+                      softmax_cross_entropy_: softmax_cross_entropy_kernel,
+                      softmax_cross_entropy_derivative:
+                          softmax_cross_entropy_derivative_kernel,
+                      softmax_cross_entropy_and_derivative:
+                          softmax_cross_entropy_and_derivative_kernel,
+                      mean_squared_error_: mean_squared_error_kernel,
+                      mean_squared_error_and_derivative:
+                          mean_squared_error_and_derivative_kernel}
+
+def get_compiled_function(func):
+    """Returns the compiled version of func (the f or f_prime of a
+    functions.Function) for 1-d arrays, or func itself if there is none or
+    numba is not available. Looking this up once avoids the Python-level
+    work of the original at every call."""
+
+    if not COMPILED:
+        return func
+    return COMPILED_FUNCTIONS.get(func, func)
+
+### --- Whole-sequence kernels --- ###
+
+@njit(cache=True, fastmath=True)
+def apply_activation(h, code):
+    """Applies the activation function indicated by code to h."""
+
+    if code == 0:
+        return np.tanh(h)
+    elif code == 1:
+        return h.copy()
+    else:
+        return 1 / (1 + np.exp(-h))
+
+@njit(cache=True, fastmath=True)
+def apply_activation_derivative(h, code):
+    """Applies the derivative of the activation indicated by code to h."""
+
+    if code == 0:
+        return 1 - np.tanh(h) ** 2
+    elif code == 1:
+        return np.ones_like(h)
+    else:
+        s = 1 / (1 + np.exp(-h))
+        return s * (1 - s)
+
+@njit(cache=True, fastmath=True)
+def apply_output_and_loss(z, y, code):
+    """Computes the final output, the error dL/dz, and the loss for the
+    (output, loss) pair indicated by code."""
+
+    if code == 0:
+        p = np.exp(z - np.max(z))
+        p = p / np.sum(p)
+        loss = -np.sum(y * np.log(np.maximum(p, 0.0001)))
+        return p, p - y, loss
+    else:
+        return z.copy(), z - y, 0.5 * np.mean((z - y) ** 2)
+
+@njit(cache=True, fastmath=True)
+def forward_scan(X, a, W_in, W_rec, b_rec, W_out, b_out, alpha, code):
+    """Runs the forward equations of network.RNN for every time step in X.
+
+    The recurrence is inherently sequential, so the time loop is serial; the
+    speedup comes from running it without any Python-level dispatch.
+
+    Args:
+        X (numpy array): Inputs of shape (T, n_in).
+        a (numpy array): Initial state of shape (n_h).
+        W_in, W_rec, b_rec, W_out, b_out (numpy arrays): Network parameters.
+        alpha (float): Inverse time constant of the network.
+        code (int): Activation code from ACTIVATION_CODES.
+    Returns:
+        Arrays H, A of shape (T, n_h) and Z of shape (T, n_out) with the
+            pre-activations, activations and outputs at each time step."""
+
+    T = X.shape[0]
+    H = np.empty((T, a.shape[0]), a.dtype)
+    A = np.empty((T, a.shape[0]), a.dtype)
+    Z = np.empty((T, b_out.shape[0]), a.dtype)
+
+    for i_t in range(T):
+        H[i_t] = W_rec.dot(a) + W_in.dot(X[i_t]) + b_rec
+        A[i_t] = (1 - alpha) * a + alpha * apply_activation(H[i_t], code)
+        a = A[i_t] #Carry the state in the dtype of the outputs
+        Z[i_t] = W_out.dot(a) + b_out
+
+    return H, A, Z
+
+@njit(cache=True, fastmath=True)
+def rflo_sgd_scan(X, Y, a, W_in, W_rec, b_rec, W_out, b_out, B,
+                  alpha, alpha_rflo, lr, code, loss_code):
+    """Trains the network with RFLO and plain SGD over every time step in X.
+
+    Equivalent to training in simulation.Simulation.run with an RFLO learning
+    algorithm (without W_FB or L2_reg) and a Stochastic_Gradient_Descent
+    optimizer (without clipping or decay). Each time step is a pure function
+    of the carried state (a, B, parameters), and the whole sequence is scanned
+    in one compiled loop.
+
+    Args:
+        X, Y (numpy arrays): Inputs and labels of shape (T, n_in), (T, n_out).
+        a (numpy array): Initial state of shape (n_h).
+        W_in, W_rec, b_rec, W_out, b_out (numpy arrays): Network parameters,
+            updated in place.
+        B (numpy array): RFLO eligibility trace of shape (n_h, m), updated in
+            place.
+        alpha (float): Inverse time constant of the network.
+        alpha_rflo (float): Inverse time constant of the eligibility trace.
+        lr (float): Learning rate.
+        code (int): Activation code from ACTIVATION_CODES.
+        loss_code (int): Output/loss code from LOSS_CODES.
+    Returns:
+        Arrays H, A of shape (T, n_h), Z, Y_hat of shape (T, n_out) and L of
+            shape (T) with the pre-activations, activations, outputs, final
+            outputs and losses at each time step."""
+
+    T = X.shape[0]
+    n_h = a.shape[0]
+    n_in = X.shape[1]
+    H = np.empty((T, n_h), a.dtype)
+    A = np.empty((T, n_h), a.dtype)
+    Z = np.empty((T, b_out.shape[0]), a.dtype)
+    Y_hat = np.empty((T, b_out.shape[0]), a.dtype)
+    L = np.empty(T)
+
+    for i_t in range(T):
+
+        #Run network forwards and get error
+        x = X[i_t]
+        a_prev = a
+        H[i_t] = W_rec.dot(a) + W_in.dot(x) + b_rec
+        h = H[i_t]
+        A[i_t] = (1 - alpha) * a + alpha * apply_activation(h, code)
+        a = A[i_t]
+        Z[i_t] = W_out.dot(a) + b_out
+        z = Z[i_t]
+        y_hat, error, loss = apply_output_and_loss(z, Y[i_t], loss_code)
+
+        #Update eligibility trace
+        D = apply_activation_derivative(h, code)
+        for i in range(n_h):
+            for j in range(n_h):
+                B[i, j] = ((1 - alpha_rflo) * B[i, j] +
+                           alpha_rflo * D[i] * a_prev[j])
+            for j in range(n_in):
+                B[i, n_h + j] = ((1 - alpha_rflo) * B[i, n_h + j] +
+                                 alpha_rflo * D[i] * x[j])
+            B[i, -1] = (1 - alpha_rflo) * B[i, -1] + alpha_rflo * D[i]
+
+        #Get gradients (with W_out before its update) and apply them
+        q = error.dot(W_out)
+        for k in range(error.shape[0]):
+            for j in range(n_h):
+                W_out[k, j] -= lr * error[k] * a[j]
+            b_out[k] -= lr * error[k]
+        for i in range(n_h):
+            for j in range(n_h):
+                W_rec[i, j] -= lr * q[i] * B[i, j]
+            for j in range(n_in):
+                W_in[i, j] -= lr * q[i] * B[i, n_h + j]
+            b_rec[i] -= lr * q[i] * B[i, -1]
+
+        Y_hat[i_t] = y_hat
+        L[i_t] = loss
+
+    return H, A, Z, Y_hat, L
+
+@njit(cache=True, fastmath=True)
+def output_and_loss_scan(Z, Y, loss_code):
+    """Computes the final outputs and losses for every time step of outputs
+    Z and labels Y, as in simulation.Simulation.forward_pass.
+
+    Args:
+        Z, Y (numpy arrays): Outputs and labels of shape (T, n_out).
+        loss_code (int): Output/loss code from LOSS_CODES.
+    Returns:
+        Arrays Y_hat of shape (T, n_out) and L of shape (T) with the final
+            outputs and losses at each time step."""
+
+    T = Z.shape[0]
+    Y_hat = np.empty(Z.shape, Z.dtype)
+    L = np.empty(T)
+
+    for i_t in range(T):
+        y_hat, error, loss = apply_output_and_loss(Z[i_t], Y[i_t], loss_code)
+        Y_hat[i_t] = y_hat
+        L[i_t] = loss
+
+    return Y_hat, L
@@ -7,11 +7,22 @@ Created on Mon Nov  5 12:54:56 2018
 """
 
 from copy import copy, deepcopy
+from operator import attrgetter
+from collections import deque
+from collections.abc import MutableMapping
 import time
-from utils import (norm, classification_accuracy, normalized_dot_product,
-                   get_spectral_radius, rgetattr)
+from utils import (norm, classification_accuracy, get_spectral_radius,
+                   first_multiple)
+from rnn_kernels import (COMPILED, get_compiled_function, get_activation_code,
+                         get_loss_code, rflo_sgd_scan, output_and_loss_scan)
+from learning_algorithms import RFLO
+from optimizers import Stochastic_Gradient_Descent
 import numpy as np
 
+#Monitors that can be filled from the outputs of a compiled scan
+COMPILED_MONITORS = {'rnn.h', 'rnn.a', 'rnn.z', 'rnn.y_hat', 'rnn.loss_',
+                     'rnn.error', 'rnn.x', 'rnn.y'}
+
 class Simulation:
     """Simulates an RNN for a provided set of inputs and training procedures.
 
@@ -24,6 +35,9 @@ class Simulation:
     different in train and test runs. Details given in __init__ and run
     docstrings."""
 
+    #Number of time steps of network noise drawn at once (see sample_noise)
+    noise_batch_size = 4096
+
     def __init__(self, rnn, allowed_kwargs_=set(), **kwargs):
         """Initialzes a simulation.Simulation object by specifying the
         attributes that will apply to both train and test instances.
@@ -56,9 +70,8 @@ class Simulation:
         self.__dict__.update(kwargs)
 
         #Set to None all unspecified attributes
-        for attr in allowed_kwargs:
-            if not hasattr(self, attr):
-                setattr(self, attr, None)
+        self.__dict__.update(dict.fromkeys(allowed_kwargs -
+                                           self.__dict__.keys()))
 
     def run(self, data, mode='train', monitors=[], **kwargs):
         """Runs the network forward as many time steps as given by data.
@@ -116,13 +129,27 @@ class Simulation:
                 yet validation loss.
             checkpoint_interval (int): Number of time steps between saving
                 rnn, learn_alg, optimizer, and i_t so that training can be
-                reproduced."""
+                reproduced.
+            checkpoint_store (DeltaCheckpointStore): Optional container for
+                the checkpoints (instead of a dict), which saves memory when
+                checkpoints are frequent. Only used if the simulation has no
+                checkpoints yet.
+            compiled (bool): Boolean that indicates whether to run the whole
+                simulation in a compiled scan when possible (see
+                can_run_compiled). Default is True.
+
+        In 'train' mode, the network's parameters are updated in place, after
+        being replaced by copies before the first update of the run (see
+        copy_params). Arrays of the parameters held elsewhere from before
+        the run (other than by the learning algorithms) are therefore left
+        unchanged and no longer those of the network."""
 
         allowed_kwargs = {'learn_alg', 'optimizer', 'a_initial', 'sigma',
                           'update_interval', 'comp_algs', 'verbose',
                           'report_interval', 'report_accuracy', 'report_loss',
                           'best_model_interval', 'checkpoint_interval',
-                          'overwrite_checkpoints', 'i_start', 'i_end'}
+                          'overwrite_checkpoints', 'checkpoint_store',
+                          'i_start', 'i_end', 'compiled'}
         for k in kwargs:
             if k not in allowed_kwargs:
                 raise TypeError('Unexpected keyword argument '
@@ -138,50 +165,72 @@ class Simulation:
         self.total_time_steps = self.x_inputs.shape[0]
 
         #Set defaults
-        self.verbose = True
-        self.report_accuracy = False
-        self.report_loss = False
-        self.comp_algs = []
-        self.report_interval = max(self.total_time_steps//10, 1)
-        self.update_interval = 1
-        self.i_start = 0
-        self.i_end = self.total_time_steps
-        self.sigma = 0
+        self.__dict__.update({'verbose': True,
+                              'report_accuracy': False,
+                              'report_loss': False,
+                              'comp_algs': [],
+                              'report_interval':
+                                  max(self.total_time_steps//10, 1),
+                              'update_interval': 1,
+                              'i_start': 0,
+                              'i_end': self.total_time_steps,
+                              'sigma': 0,
+                              'compiled': True})
 
         #Overwrite defaults with any provided keyword args
         self.__dict__.update(kwargs)
 
-        #Set to None all unspecified attributes
-        for attr in allowed_kwargs:
-            if not hasattr(self, attr):
-                setattr(self, attr, None)
+        #Set to None all unspecified attributes in one update
+        self.__dict__.update(dict.fromkeys(allowed_kwargs -
+                                           self.__dict__.keys()))
 
         ### --- Pre-run housekeeping --- ###
 
         self.initialize_run()
 
-        for i_t in range(self.i_start, self.i_end):
+        if self.can_run_compiled():
+            self.run_compiled()
 
-            self.i_t = i_t
+        #Outer loop over trials (the whole run if there is no trial
+        #structure), inner loop over the time steps of each trial
+        i_trial_first = self.i_t + 1
+        while i_trial_first < self.i_end:
 
             ### --- Reset model if there is a trial structure --- ###
 
-            if self.time_steps_per_trial is not None:
-                self.trial_structure()
+            if self.time_steps_per_trial is None:
+                self.trial_start = 0
+                i_trial_end = self.i_end
+            else:
+                tpt = self.time_steps_per_trial
+                self.trial_start = i_trial_first - i_trial_first%tpt
+                i_trial_end = min(self.trial_start + tpt, self.i_end)
+                if i_trial_first == self.trial_start:
+                    self.i_trial = self.trial_start//tpt
+                    if self.reset_sigma is not None:
+                        self.rnn.reset_network(sigma=self.reset_sigma)
+                        self.learn_alg.reset_learning()
+
+            for i_t in range(i_trial_first, i_trial_end):
 
-            ### --- Run network forwards and get error --- ###
+                self.i_t = i_t
+                self.i_t_trial = i_t - self.trial_start
 
-            self.forward_pass(self.x_inputs[i_t],
-                              self.y_labels[i_t])
+                ### --- Run network forwards and get error --- ###
 
-            ### --- Update parameters if in 'train' mode --- ###
+                self.forward_pass(self.x_inputs[i_t],
+                                  self.y_labels[i_t])
 
-            if self.mode == 'train':
-                self.train_step()
+                ### --- Update parameters if in 'train' mode --- ###
 
-            ### --- Clean up --- ###
+                if self.mode == 'train':
+                    self.train_step()
 
-            self.end_time_step(data)
+                ### --- Clean up --- ###
+
+                self.end_time_step(data)
+
+            i_trial_first = i_trial_end
 
         #At end of run, convert monitor lists into numpy arrays
         self.monitors_to_arrays()
@@ -189,9 +238,14 @@ class Simulation:
         #Checkpoint final model
         self.checkpoint_model()
 
-        #Delete data to save space
+        #Delete data to save space, and compiled functions that should not be
+        #pickled with the simulation
         del(self.x_inputs)
         del(self.y_labels)
+        del(self.step_mask)
+        del(self.noise_batch)
+        del(self.output_f, self.loss_f_and_f_prime)
+        del(self.test_sim)
 
     def initialize_run(self):
         """Initializes a few variables before the time loop."""
@@ -199,14 +253,32 @@ class Simulation:
         #Initial best validation loss is infinite
         self.best_val_loss = np.inf
 
+        #Test simulation for reports and best models, created when first
+        #needed and reused for the rest of the run
+        self.test_sim = None
+
+        #Select compiled output and loss functions once for the whole run
+        self.output_f = get_compiled_function(self.rnn.output.f)
+        if self.rnn.loss.f_and_f_prime is not None:
+            self.loss_f_and_f_prime = get_compiled_function(
+                self.rnn.loss.f_and_f_prime)
+        else:
+            loss_f = get_compiled_function(self.rnn.loss.f)
+            loss_f_prime = get_compiled_function(self.rnn.loss.f_prime)
+            self.loss_f_and_f_prime = lambda z, y: (loss_f(z, y),
+                                                    loss_f_prime(z, y))
+
         #Set up checkpoints dict if doesn't already exist from previous run
         if not hasattr(self, 'checkpoints'):
-            self.checkpoints = {}
+            if self.checkpoint_store is not None:
+                self.checkpoints = self.checkpoint_store
+            else:
+                self.checkpoints = {}
 
         #Initialize rec_grads_dicts
         if self.mode == 'train':
             self.algs = [self.learn_alg] + self.comp_algs
-            self.rec_grads_dict = {alg.name:[] for alg in self.algs}
+            self.params_copied = False
             self.T_lag = 0
             for alg in self.algs:
                 try:
@@ -214,9 +286,38 @@ class Simulation:
                         self.T_lag = alg.T_truncation
                 except AttributeError:
                     pass
-
-        #Initialize monitors
-        self.mons = {mon:[] for mon in self.monitors}
+            #Keep each algorithm's rec_grads only as long as the truncation
+            #horizon, the oldest being dropped on append
+            self.rec_grads_dict = {alg.name:deque(maxlen=max(self.T_lag, 1))
+                                   for alg in self.algs}
+            #Resolve once each algorithm's deque, and which of its entries
+            #enters the alignment matrix (for comparison with Future_BPTT,
+            #must lag gradients by the truncation horizon)
+            self.alg_rec_grads = [self.rec_grads_dict[alg.name]
+                                  for alg in self.algs]
+            self.lagged_rec_grads = [(rec_grads, -1 if 'F-BPTT' in key else 0)
+                                     for key, rec_grads
+                                     in self.rec_grads_dict.items()]
+
+        #Initialize monitors, whose arrays are allocated the first time each
+        #monitor is recorded (see record_monitor). Attribute lookups are
+        #resolved once here rather than at every time step.
+        self.mons = {mon:None for mon in self.monitors}
+        self.n_mons = {mon:0 for mon in self.monitors}
+        #Spectral radii and norms to compute at each step, as (monitor key,
+        #getter for the underlying attribute, function) triples
+        self.radius_and_norm_ops = []
+        for feature, func in zip(['radius', 'norm'],
+                                 [get_spectral_radius, norm]):
+            for key in self.mons:
+                if feature in key:
+                    attr = key.split('-')[0]
+                    self.radius_and_norm_ops.append((key, attrgetter(attr),
+                                                     func))
+        #Derived radius/norm keys are not attributes, so they get no getter
+        derived_keys = {op[0] for op in self.radius_and_norm_ops}
+        self.mon_getters = {mon:attrgetter(mon) for mon in self.monitors
+                            if mon not in derived_keys}
         #Make all relevant algorithms attributes of self
         if self.mode == 'train':
             for comp_alg in self.comp_algs:
@@ -235,15 +336,147 @@ class Simulation:
         #Track computation time
         self.start_time = time.time()
 
-    def trial_structure(self):
-        """Resets learning algorithm and/or network state between trials."""
+        #Network noise is drawn noise_batch_size time steps at a time from a
+        #numpy Generator, seeded from np.random so that np.random.seed still
+        #makes runs reproducible
+        self.noise_batch = None
+        if self.sigma is not None and self.sigma > 0:
+            self.noise_rng = np.random.default_rng(np.random.randint(2**31))
+
+        #Lay the trial mask out over every time step, so that it is indexed
+        #directly by i_t
+        self.step_mask = None
+        if self.trial_mask is not None:
+            self.step_mask = np.resize(self.trial_mask, self.i_end)
+
+        #Time step before the first one to run
+        self.i_t = self.i_start - 1
 
-        self.i_t_trial = self.i_t%self.time_steps_per_trial
-        if self.i_t_trial == 0:
-            self.i_trial = self.i_t//self.time_steps_per_trial
-            if self.reset_sigma is not None:
-                self.rnn.reset_network(sigma=self.reset_sigma)
-                self.learn_alg.reset_learning()
+        #Time steps of the next scheduled events, checked against i_t at each
+        #step instead of taking remainders (-1 for events that never happen)
+        self.next_update = first_multiple(self.i_start, self.update_interval)
+        self.next_best_model = -1
+        if self.best_model_interval is not None and self.mode == 'train':
+            self.next_best_model = first_multiple(self.i_start,
+                                                  self.best_model_interval)
+        self.next_checkpoint = -1
+        if self.checkpoint_interval is not None and self.mode == 'train':
+            if type(self.checkpoint_interval) is int:
+                self.checkpoint_steps = None
+                self.next_checkpoint = first_multiple(self.i_start,
+                                                      self.checkpoint_interval)
+            if type(self.checkpoint_interval) is list:
+                self.checkpoint_steps = iter(sorted(
+                    {i for i in self.checkpoint_interval if i >= self.i_start}))
+                self.next_checkpoint = next(self.checkpoint_steps, -1)
+        self.next_report = -1
+        if self.verbose:
+            self.next_report = first_multiple(max(self.i_start, 1),
+                                              self.report_interval)
+
+    def can_run_compiled(self):
+        """Returns True if the whole run can be done by a compiled scan from
+        rnn_kernels, i.e. if nothing in the run needs Python at each time
+        step.
+
+        Test runs need supported activation, output and loss functions. Train
+        runs additionally need plain RFLO with plain SGD at every time step,
+        and no comparison algorithms, best models or checkpoints."""
+
+        rnn = self.rnn
+
+        if not (self.compiled and COMPILED):
+            return False
+        if (get_activation_code(rnn.activation) is None or
+            get_loss_code(rnn.output, rnn.loss) is None):
+            return False
+        if (self.time_steps_per_trial is not None or
+            self.trial_mask is not None or
+            self.sigma != 0 or self.verbose):
+            return False
+        if not set(self.monitors) <= COMPILED_MONITORS:
+            return False
+        if self.mode == 'test':
+            return True
+
+        learn_alg = self.learn_alg
+        optimizer = self.optimizer
+        return (type(learn_alg) is RFLO and
+                learn_alg.W_FB is None and learn_alg.L2_reg is None and
+                type(optimizer) is Stochastic_Gradient_Descent and
+                optimizer.lr_decay_rate is None and
+                optimizer.clip_norm is None and
+                self.update_interval == 1 and len(self.comp_algs) == 0 and
+                self.best_model_interval is None and
+                self.checkpoint_interval is None)
+
+    def run_compiled(self):
+        """Runs every time step in one compiled scan and leaves the network,
+        learning algorithm and monitors as the time loop would have.
+
+        Attributes of the learning algorithm other than B (e.g. a_hat, D, q)
+        are not updated."""
+
+        rnn = self.rnn
+        dtype = rnn.W_rec.dtype
+        X = self.x_inputs[self.i_start:self.i_end]
+        Y = self.y_labels[self.i_start:self.i_end]
+        if X.shape[0] == 0:
+            return
+        Y_ = np.ascontiguousarray(Y, dtype=dtype)
+        loss_code = get_loss_code(rnn.output, rnn.loss)
+
+        if self.mode == 'test':
+            H, A, Z = rnn.run_forward(X)
+            Y_hat, L = output_and_loss_scan(Z, Y_, loss_code)
+        else:
+            #The scan updates parameters and B in place, so work on copies
+            self.copy_params()
+            self.learn_alg.B = np.array(self.learn_alg.B, dtype=dtype)
+            H, A, Z, Y_hat, L = rflo_sgd_scan(
+                np.ascontiguousarray(X, dtype=dtype), Y_,
+                np.array(rnn.a, dtype=dtype),
+                rnn.W_in, rnn.W_rec, rnn.b_rec, rnn.W_out, rnn.b_out,
+                self.learn_alg.B, float(rnn.alpha),
+                float(self.learn_alg.alpha), float(self.optimizer.lr),
+                get_activation_code(rnn.activation), loss_code)
+            rnn.set_final_state(X, H, A, Z)
+
+        #Leave the simulation as at the end of the last time step
+        self.i_t = self.i_end - 1
+        rnn.x, rnn.y = X[-1], Y[-1]
+        rnn.y_hat = Y_hat[-1].copy()
+        rnn.loss_ = L[-1]
+        rnn.error = Y_hat[-1] - Y_[-1]
+        rnn.x_prev = rnn.x
+        rnn.y_prev = rnn.y
+
+        #Fill monitors from the scan outputs
+        values = {'rnn.h': H, 'rnn.a': A, 'rnn.z': Z, 'rnn.y_hat': Y_hat,
+                  'rnn.loss_': L, 'rnn.x': X, 'rnn.y': Y}
+        for key in self.monitors:
+            if key == 'rnn.error':
+                self.mons[key] = Y_hat - Y_
+            else:
+                self.mons[key] = np.array(values[key])
+            self.n_mons[key] = X.shape[0]
+
+    def sample_noise(self):
+        """Returns the noise added to the network at the current time step,
+        distributed as sigma * N(0, alpha) like the noise drawn by
+        network.RNN.next_state."""
+
+        if self.noise_batch is None or self.i_noise == self.noise_batch_size:
+            rnn = self.rnn
+            self.noise_batch = self.noise_rng.standard_normal(
+                (self.noise_batch_size, rnn.n_h), dtype=rnn.W_rec.dtype)
+            self.noise_batch *= self.sigma * rnn.alpha
+            self.i_noise = 0
+
+        noise = self.noise_batch[self.i_noise]
+        self.i_noise += 1
+
+        return noise
 
     def forward_pass(self, x, y):
         """Runs network forward, computes immediate losses and errors."""
@@ -256,18 +489,22 @@ class Simulation:
         rnn.y = y
 
         #Run network forwards and get predictions
-        rnn.next_state(rnn.x, sigma=self.sigma)
-        rnn.z_out()
+        if self.sigma > 0:
+            rnn.next_state(rnn.x, sigma=self.sigma, noise=self.sample_noise(),
+                           buffered=True)
+        else:
+            rnn.next_state(rnn.x, buffered=True)
+        rnn.z_out(buffered=True)
 
         #Compare outputs with labels, get immediate loss and errors
-        rnn.y_hat = rnn.output.f(rnn.z)
-        rnn.loss_ = rnn.loss.f(rnn.z, rnn.y)
-        rnn.error = rnn.loss.f_prime(rnn.z, rnn.y)
+        rnn.y_hat = self.output_f(rnn.z)
+        rnn.loss_, rnn.error = self.loss_f_and_f_prime(rnn.z, rnn.y)
 
         #Re-scale losses and errors if trial structure is provided
-        if self.trial_mask is not None:
-            rnn.loss_ *= self.trial_mask[self.i_t_trial]
-            rnn.error *= self.trial_mask[self.i_t_trial]
+        if self.step_mask is not None:
+            m = self.step_mask[self.i_t]
+            rnn.loss_ *= m
+            rnn.error *= m
 
     def train_step(self):
         """Uses self.learn_alg to calculate gradients and self.optimizer to
@@ -291,11 +528,36 @@ class Simulation:
         ### --- Pass gradients to optimizer --- ###
 
         #Only update on schedule (default update_interval=1)
-        if self.i_t%self.update_interval == 0:
-            #Get updated parameters
-            rnn.params = self.optimizer.get_updated_params(rnn.params,
-                                                           self.grads_list)
-            rnn.W_rec, rnn.W_in, rnn.b_rec, rnn.W_out, rnn.b_out = rnn.params
+        if self.i_t == self.next_update:
+            self.next_update += self.update_interval
+            #Update parameters in place, after copying them once per run
+            if not self.params_copied:
+                self.copy_params()
+            self.optimizer.update_params(rnn.params, self.grads_list)
+
+    def copy_params(self):
+        """Replaces the network's parameters with copies, before they are
+        first updated in place in a training run, so that arrays shared with
+        the caller (e.g. a W_rec passed to several RNNs) are never changed.
+
+        Any of the old arrays held directly by a learning algorithm, or by a
+        network among its attributes, is replaced by its copy, so that it
+        still sees the parameters being trained."""
+
+        old_params = self.rnn.params
+        self.rnn.params = [np.copy(w) for w in old_params]
+        copies = {id(w): w_copy for w, w_copy in
+                  zip(old_params, self.rnn.params)}
+
+        for alg in self.algs:
+            objs = [alg] + [obj for obj in alg.__dict__.values()
+                            if hasattr(obj, 'params') and obj is not self.rnn]
+            for obj in objs:
+                for key, value in list(obj.__dict__.items()):
+                    if id(value) in copies:
+                        setattr(obj, key, copies[id(value)])
+
+        self.params_copied = True
 
     def end_time_step(self, data):
         """Cleans up after each time step in the time loop."""
@@ -307,27 +569,26 @@ class Simulation:
         self.update_monitors()
 
         #Evaluate model and save if performance is best
-        if self.best_model_interval is not None and self.mode == 'train':
-            if self.i_t % self.best_model_interval == 0:
-                self.save_best_model(data)
+        if self.i_t == self.next_best_model:
+            self.next_best_model += self.best_model_interval
+            self.save_best_model(data)
 
-        if self.checkpoint_interval is not None and self.mode == 'train':
-            if type(self.checkpoint_interval) is int:
-                if self.i_t % self.checkpoint_interval == 0:
-                    self.checkpoint_model()
-            if type(self.checkpoint_interval) is list:
-                if self.i_t in self.checkpoint_interval:
-                    self.checkpoint_model()
+        if self.i_t == self.next_checkpoint:
+            if self.checkpoint_steps is None:
+                self.next_checkpoint += self.checkpoint_interval
+            else:
+                self.next_checkpoint = next(self.checkpoint_steps, -1)
+            self.checkpoint_model()
 
         #Make report if conditions are met
-        if (self.i_t % self.report_interval == 0 and
-            self.i_t > 0 and
-            self.verbose):
+        if self.i_t == self.next_report:
+            self.next_report += self.report_interval
             self.report_progress(data)
 
-        #Current inputs/labels become previous inputs/labels
-        self.rnn.x_prev = self.rnn.x.copy()
-        self.rnn.y_prev = self.rnn.y.copy()
+        #Current inputs/labels become previous inputs/labels. These are rows
+        #of the data arrays, which nothing modifies, so no copy is needed.
+        self.rnn.x_prev = self.rnn.x
+        self.rnn.y_prev = self.rnn.y
 
     def report_progress(self, data):
         """"Reports progress at specified interval, including test run
@@ -338,97 +599,202 @@ class Simulation:
 
         summary = '\rProgress: {}% complete \nTime Elapsed: {}s \n'
 
-        if 'rnn.loss_' in self.mons.keys():
+        if self.n_mons.get('rnn.loss_', 0) > 0:
             interval = self.report_interval
-            avg_loss = sum(self.mons['rnn.loss_'][-interval:])/interval
+            n = self.n_mons['rnn.loss_']
+            recent_losses = self.mons['rnn.loss_'][max(n - interval, 0):n]
+            avg_loss = np.mean(recent_losses)
             loss = 'Average loss: {} \n'.format(avg_loss)
             summary += loss
 
         if self.report_accuracy or self.report_loss:
-            test_sim = self.get_test_sim()
-            test_sim.run(data, mode='test',
-                         monitors=['rnn.y_hat', 'rnn.loss_'],
-                         verbose=False,
-                         a_initial=np.copy(self.rnn.a))
+            Y_hat, L = self.run_test(data)
             if self.report_accuracy:
-                acc = classification_accuracy(data, test_sim.mons['rnn.y_hat'])
+                acc = classification_accuracy(data, Y_hat)
                 accuracy = 'Test accuracy: {} \n'.format(acc)
                 summary += accuracy
             if self.report_loss:
-                test_loss = np.mean(test_sim.mons['rnn.loss_'])
+                test_loss = np.mean(L)
                 loss_summary = 'Test loss: {} \n'.format(test_loss)
                 summary += loss_summary
 
         print(summary.format(progress, time_elapsed))
 
     def update_monitors(self):
-        """Loops through the monitor keys and appends current value of any
-        object's attribute found."""
+        """Loops through the monitor keys and records current value of any
+        object's attribute found.
 
-        for key in self.mons:
+        Attributes not found are skipped at that time step only, since some
+        (e.g. of the learning algorithm) only exist after the first steps."""
+
+        for key, getter in self.mon_getters.items():
             try:
-                self.mons[key].append(rgetattr(self, key))
+                value = getter(self)
             except AttributeError:
-                pass
+                continue
+            self.record_monitor(key, value)
+
+    def record_monitor(self, key, value):
+        """Writes value into the next entry of the monitor array for key.
+
+        The array is allocated on the first call for each key, with room for
+        every time step of the run and the shape and dtype of value. If a
+        later value needs a wider dtype, the array is upcast. If a later value
+        has a different shape, or the values cannot form a numeric array
+        (e.g. the list of arrays rnn.params), the monitor falls back to a
+        list of copies of the values."""
+
+        i_mon = self.n_mons[key]
+        mon = self.mons[key]
+        if type(mon) is list:
+            mon.append(deepcopy(value))
+            self.n_mons[key] = i_mon + 1
+            return
+        try:
+            array = np.asarray(value)
+        except ValueError:
+            array = None
+        if (array is None or array.dtype == object or
+                (i_mon > 0 and array.shape != mon.shape[1:])):
+            #Ragged values (e.g. rnn.params) or a change of shape
+            head = [] if i_mon == 0 else list(mon[:i_mon])
+            self.mons[key] = head + [deepcopy(value)]
+            self.n_mons[key] = i_mon + 1
+            return
+        if i_mon == 0:
+            T = self.i_end - self.i_start
+            mon = np.empty((T,) + array.shape, dtype=array.dtype)
+            self.mons[key] = mon
+        elif not np.can_cast(array.dtype, mon.dtype):
+            mon = mon.astype(np.result_type(mon, array))
+            self.mons[key] = mon
+        mon[i_mon] = array
+        self.n_mons[key] = i_mon + 1
 
     def monitors_to_arrays(self):
-        """Recasts monitors (lists by default) as numpy arrays for ease of use
-        after running."""
-
-        for key in self.mons:
-            try:
-                self.mons[key] = np.array(self.mons[key])
-            except ValueError:
-                pass
+        """Trims each monitor array to the number of values actually recorded
+        (monitors never recorded become empty arrays). Monitors that fell
+        back to lists (see record_monitor) stay lists, since their values
+        differ in shape."""
+
+        for key, mon in self.mons.items():
+            n = self.n_mons[key]
+            if mon is None:
+                self.mons[key] = np.array([])
+            elif type(mon) is not list and n < mon.shape[0]:
+                self.mons[key] = mon[:n].copy()
 
     def get_radii_and_norms(self):
         """Calculates the spectral radii and/or norms of any monitor keys
         where this is specified."""
 
-        for feature, func in zip(['radius', 'norm'],
-                                 [get_spectral_radius, norm]):
-            for key in self.mons:
-                if feature in key:
-                    attr = key.split('-')[0]
-                    self.mons[key].append(func(rgetattr(self, attr)))
+        for key, getter, func in self.radius_and_norm_ops:
+            self.record_monitor(key, func(getter(self)))
 
     def save_best_model(self, data):
         """Runs a test simulation, compares loss to current best model, and
         replaces the best model if the test loss is lower than previous lowest
-        test loss."""
+        test loss.
 
-        val_sim = self.get_test_sim()
-        val_sim.run(data, mode='test',
-                    monitors=['rnn.y_hat', 'rnn.loss_'],
-                    verbose=False)
-        val_loss = np.mean(val_sim.mons['rnn.loss_'])
+        Only copies of the best parameters are kept, in self.best_params (see
+        get_best_rnn)."""
+
+        _, L = self.run_test(data)
+        val_loss = np.mean(L)
 
         if val_loss < self.best_val_loss:
-            self.best_rnn = val_sim.rnn
+            self.best_params = [np.copy(w) for w in self.rnn.params]
             self.best_val_loss = val_loss
 
+    def run_test(self, data):
+        """Runs a copy of the network, from its current state, over the test
+        data without the time loop and monitors of a full test simulation.
+
+        Args:
+            data (dict): Data dict as in run.
+        Returns:
+            Arrays Y_hat of shape (T, n_out) and L of shape (T) with the final
+                outputs and losses at each time step."""
+
+        rnn = self.get_test_sim().rnn
+        Y = data['test']['Y']
+        _, _, Z = rnn.run_forward(data['test']['X'])
+
+        loss_code = get_loss_code(rnn.output, rnn.loss)
+        if loss_code is not None:
+            return output_and_loss_scan(Z, np.ascontiguousarray(Y, Z.dtype),
+                                        loss_code)
+
+        output_f = get_compiled_function(rnn.output.f)
+        loss_f = get_compiled_function(rnn.loss.f)
+        Y_hat = np.array([output_f(z) for z in Z])
+        L = np.array([loss_f(z, y) for z, y in zip(Z, Y)])
+        return Y_hat, L
+
+    def get_best_rnn(self):
+        """Returns a copy of the network with the parameters that gave the
+        lowest validation loss in save_best_model, or None if no best model
+        has been saved.
+
+        Simulations pickled when the best network itself was kept (as
+        best_rnn) return that network."""
+
+        if 'best_rnn' in self.__dict__:
+            return self.__dict__['best_rnn']
+        if getattr(self, 'best_params', None) is None:
+            return None
+
+        best_rnn = deepcopy(self.rnn)
+        best_rnn.params = [np.copy(w) for w in self.best_params]
+
+        return best_rnn
+
+    @property
+    def best_rnn(self):
+        """The network with the best parameters (see get_best_rnn), kept as
+        an attribute for compatibility. A new copy is made on every access."""
+
+        return self.get_best_rnn()
+
+    @best_rnn.setter
+    def best_rnn(self, rnn):
+        self.best_params = [np.copy(w) for w in rnn.params]
+        self.__dict__.pop('best_rnn', None)
+
     def checkpoint_model(self):
         """Creates copies of all relevant objects for reproducing training
         trajectory."""
 
-        checkpoint = {'rnn': deepcopy(self.rnn),
-                      'learn_alg': deepcopy(self.learn_alg),
-                      'optimizer': deepcopy(self.optimizer),
-                      'i_t': copy(self.i_t)}
         if (self.i_t not in self.checkpoints.keys() or 
             self.overwrite_checkpoints):
+            checkpoint = {'rnn': deepcopy(self.rnn),
+                          'learn_alg': deepcopy(self.learn_alg),
+                          'optimizer': deepcopy(self.optimizer),
+                          'i_t': copy(self.i_t)}
             self.checkpoints[self.i_t] = checkpoint
 
     def get_test_sim(self):
         """Creates what is effectively a copy of the current simulation, but
-        saving on memory by omitting monitors or other large attributes."""
-
-        sim = Simulation(deepcopy(self.rnn),
-                         time_steps_per_trial=self.time_steps_per_trial,
-                         reset_sigma=self.reset_sigma,
-                         i_job=self.i_job,
-                         save_dir=self.save_dir)
-        return sim
+        saving on memory by omitting monitors or other large attributes.
+
+        The copy is made once per run. Later calls return the same test
+        simulation, with its network given the current parameters (shared,
+        since test runs do not change them) and a copy of the current
+        state."""
+
+        if getattr(self, 'test_sim', None) is None:
+            self.test_sim = Simulation(
+                deepcopy(self.rnn),
+                time_steps_per_trial=self.time_steps_per_trial,
+                reset_sigma=self.reset_sigma,
+                i_job=self.i_job,
+                save_dir=self.save_dir)
+        else:
+            rnn = self.test_sim.rnn
+            rnn.params = self.rnn.params
+            rnn.h, rnn.a = np.copy(self.rnn.h), np.copy(self.rnn.a)
+
+        return self.test_sim
 
     def compare_algorithms(self):
         """Computes alignment matrix for different learning algorithms run
@@ -436,47 +802,31 @@ class Simulation:
 
         #Update learning variables for the algorithms *not* being used to train
         #the network
-        for i_alg, alg in enumerate(self.algs):
+        for i_alg, (alg, rec_grads) in enumerate(zip(self.algs,
+                                                     self.alg_rec_grads)):
             if i_alg > 0: #Only the comparison algorithms
                 alg.update_learning_vars()
                 alg()
-            key = alg.name
-            #Store the rec_grad array for each algorithm in a list
-            self.rec_grads_dict[key].append(alg.rec_grads)
+            #Store the rec_grad array for each algorithm in its deque
+            rec_grads.append(alg.rec_grads)
         #Get array of gradient alignments
-        if 'alignment_matrix' in self.mons.keys():
-            n_algs = len(self.algs)
-            self.alignment_matrix = np.zeros((n_algs, n_algs))
-            self.alignment_weights = np.zeros((n_algs, n_algs))
-            for i, key_i in enumerate(self.rec_grads_dict):
-                for j, key_j in enumerate(self.rec_grads_dict):
-
-                    #For comparison with Future_BPTT, must lag gradients by
-                    #the truncation horizon
-                    if 'F-BPTT' in key_i:
-                        i_index = -1
-                    else:
-                        i_index = 0
-                    if 'F-BPTT' in key_j:
-                        j_index = -1
-                    else:
-                        j_index = 0
-
-                    #Store normalized dot product for each pair of algorithms
-                    #in the alignment matrix and norm product in alignment
-                    #strength matrix.
-                    g_i = self.rec_grads_dict[key_i][i_index]
-                    g_j = self.rec_grads_dict[key_j][j_index]
-                    alignment = normalized_dot_product(g_i, g_j)
-                    self.alignment_matrix[i, j] = alignment
-                    self.alignment_weights[i, j] = norm(g_i) * norm(g_j)
-
-        #Keep each list (for each algorithm) of rec_grads only as long as the
-        #truncation horizon by deleting the oldest one.
-        for key in self.rec_grads_dict:
-            if len(self.rec_grads_dict[key]) >= self.T_lag:
-                del(self.rec_grads_dict[key][0])
-                
+        if 'alignment_matrix' in self.mons:
+            #Stack the flattened (and possibly lagged) gradient of each
+            #algorithm as a row of G.
+            G = np.stack([np.ravel(rec_grads[i_lag])
+                          for rec_grads, i_lag in self.lagged_rec_grads])
+
+            #Get all dot products in one matrix product, and store normalized
+            #dot product for each pair of algorithms in the alignment matrix
+            #(0 if either gradient is 0) and norm product in alignment
+            #strength matrix.
+            inner = G.dot(G.T)
+            norms = np.sqrt(np.diagonal(inner))
+            self.alignment_weights = np.multiply.outer(norms, norms)
+            self.alignment_matrix = np.divide(inner, self.alignment_weights,
+                                              out=np.zeros_like(inner),
+                                              where=self.alignment_weights > 0)
+
     def resume_sim_at_checkpoint(self, data, i_checkpoint, N=None,
                                  checkpoint_interval=None,
                                  overwrite_checkpoints=False,
@@ -537,3 +887,115 @@ class Simulation:
 
 
 
+
+class DeltaCheckpointStore(MutableMapping):
+    """Dict-like container for the checkpoints of a Simulation that stores
+    the RNN parameters of most checkpoints relative to a recent 'base'
+    checkpoint.
+
+    Every base_interval-th checkpoint stored becomes a new base, whose
+    parameters are kept in full. For every other checkpoint, each parameter
+    (W_rec, W_in, b_rec, W_out, b_out) is not stored at all if its relative
+    change from the base is no more than epsilon, in which case it is
+    reconstructed as its base value. Otherwise it is stored as the indices
+    and values of its entries that differ from the base if fewer than half
+    of them do, and as a dense copy if not, so a checkpoint never takes more
+    space than it would in a dict. With epsilon=0 (default) the stored
+    parameters are exact.
+
+    The parameters are also stripped from the copy of the network held by
+    the learning algorithm, which is restored as the same object as the
+    checkpoint's 'rnn'.
+
+    Checkpoints are reconstructed on access, so sim.checkpoints[i_t] works
+    as for a dict. Only the RNN parameters are encoded this way; the other
+    objects in a checkpoint are stored as given."""
+
+    param_names = ['W_rec', 'W_in', 'b_rec', 'W_out', 'b_out']
+
+    def __init__(self, base_interval=100, epsilon=0):
+        """Inits an empty store.
+
+        Args:
+            base_interval (int): Number of checkpoints stored between (and
+                including) consecutive base checkpoints.
+            epsilon (float): Threshold on ||w - w_base||/||w_base|| at or
+                below which a parameter w is not stored."""
+
+        self.base_interval = base_interval
+        self.epsilon = epsilon
+        self.entries = {}
+        self.bases = {}
+        self.i_base = None
+        self.n_stored = 0
+
+    def __setitem__(self, i_t, checkpoint):
+        """Stores a checkpoint dict with an 'rnn' key, as created by
+        Simulation.checkpoint_model."""
+
+        params = checkpoint['rnn'].params
+        if self.n_stored % self.base_interval == 0:
+            self.i_base = i_t
+            self.bases[i_t] = [np.copy(w) for w in params]
+        self.n_stored += 1
+
+        deltas = []
+        for w, w_base in zip(params, self.bases[self.i_base]):
+            diff = w - w_base
+            if norm(diff) <= self.epsilon * norm(w_base):
+                deltas.append(None)
+                continue
+            indices = np.flatnonzero(diff)
+            if 2 * indices.size < w.size:
+                deltas.append((indices, w.reshape(-1)[indices]))
+            else:
+                deltas.append(np.copy(w))
+
+        #Keep a shallow copy of the rnn without its parameters
+        rnn = copy(checkpoint['rnn'])
+        for name in self.param_names:
+            setattr(rnn, name, None)
+        stored = dict(checkpoint, rnn=rnn)
+
+        #Point the learning algorithm's copy of the rnn to the stripped one
+        learn_alg = checkpoint.get('learn_alg')
+        alg_rnn = getattr(learn_alg, 'rnn', None)
+        if alg_rnn is not None and all(
+                np.array_equal(w_alg, w) for w_alg, w in
+                zip(alg_rnn.params, params)):
+            learn_alg = copy(learn_alg)
+            learn_alg.rnn = rnn
+            stored['learn_alg'] = learn_alg
+
+        self.entries[i_t] = (stored, self.i_base, deltas)
+
+    def __getitem__(self, i_t):
+        """Reconstructs the checkpoint stored at i_t."""
+
+        stored, i_base, deltas = self.entries[i_t]
+
+        params = []
+        for w_base, delta in zip(self.bases[i_base], deltas):
+            if type(delta) is tuple:
+                w = np.copy(w_base)
+                w.reshape(-1)[delta[0]] = delta[1]
+            elif delta is None:
+                w = np.copy(w_base)
+            else:
+                w = np.copy(delta)
+            params.append(w)
+
+        #Copy all objects together so the learning algorithm shares the rnn
+        checkpoint = deepcopy(stored)
+        checkpoint['rnn'].params = params
+
+        return checkpoint
+
+    def __delitem__(self, i_t):
+        del(self.entries[i_t])
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
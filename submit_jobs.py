@@ -10,6 +10,7 @@ import subprocess
 import os
 import numpy as np
 import pickle
+from utils import load_pickle
 
 def clear_results(job_file, data_path='/Users/omarschall/cluster_results/vanilla-rtrl/'):
 
@@ -136,8 +137,7 @@ def process_results(job_file):
 
     for i_file, file in enumerate(dir_list):
 
-        with open(os.path.join(data_path, file), 'rb') as f:
-            data = pickle.load(f)
+        data = load_pickle(os.path.join(data_path, file))
 
         if i_file == 0:
 
@@ -170,8 +170,7 @@ def process_results(job_file):
     sim_dict = {}
     for i_file, file in enumerate(dir_list):
 
-        with open(os.path.join(data_path, file), 'rb') as f:
-            data = pickle.load(f)
+        data = load_pickle(os.path.join(data_path, file))
 
         sim_dict_key = ''
         index = []
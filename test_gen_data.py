@@ -8,6 +8,8 @@ Created on Mon May 13 14:19:07 2019
 
 import numpy as np
 import unittest
+import os
+import tempfile
 from gen_data import *
 
 class Test_Gen_Data(unittest.TestCase):
@@ -123,6 +125,62 @@ class Test_Gen_Data(unittest.TestCase):
             self.assertTrue(np.isclose(data['train']['Y'][i,:],
                                        data['train']['Y'][i+1,:]).all())
 
+    def test_data_cache(self):
+        """Verifies that cached data are reloaded (memory-mapped) for the same
+        task config and random state, leaving np.random in the same state as
+        generating the data would."""
+
+        task = Add_Task(4, 7)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            np.random.seed(0)
+            data_1 = task.gen_data(100, 20, cache_dir=cache_dir)
+            x_1 = np.random.rand()
+            np.random.seed(0)
+            data_2 = task.gen_data(100, 20, cache_dir=cache_dir)
+            x_2 = np.random.rand()
+            data_3 = task.gen_data(100, 20, cache_dir=cache_dir)
+
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+            self.assertIsInstance(data_2['train']['X'], np.memmap)
+            self.assertEqual(x_1, x_2)
+            for mode in ['train', 'test']:
+                for var in ['X', 'Y']:
+                    self.assertTrue((data_1[mode][var] ==
+                                     data_2[mode][var]).all())
+            self.assertFalse((data_1['train']['X'] ==
+                              data_3['train']['X']).all())
+
+    def test_cache_key_numpy_scalars(self):
+        """Verifies that task parameters given as numpy scalars are part of
+        the cache key."""
+
+        np.random.seed(0)
+        key_1 = Add_Task(np.int64(4), np.int64(7)).get_cache_key(100, 20)
+        key_2 = Add_Task(np.int64(4), np.int64(8)).get_cache_key(100, 20)
+        key_3 = Add_Task(4, 7).get_cache_key(100, 20)
+
+        self.assertNotEqual(key_1, key_2)
+        self.assertEqual(key_1, key_3)
+
+    def test_cache_key_arrays(self):
+        """Verifies that list and array task parameters are part of the cache
+        key, and that tasks with parameters that cannot be encoded are not
+        cached."""
+
+        keys = []
+        for value in [[1, 2], [1, 3], np.zeros(3), np.ones(3)]:
+            task = Add_Task(4, 7)
+            task.gains = value
+            np.random.seed(0)
+            keys.append(task.get_cache_key(100, 20))
+        self.assertEqual(len(set(keys)), 4)
+
+        task = Add_Task(4, 7)
+        task.gains = object()
+        with tempfile.TemporaryDirectory() as cache_dir:
+            task.gen_data(100, 20, cache_dir=cache_dir)
+            self.assertEqual(os.listdir(cache_dir), [])
+
     def test_flip_flop(self):
 
         task = Flip_Flop_Task(3, 0)
@@ -9,6 +9,8 @@ Created on Tue Feb 12 12:32:35 2019
 import numpy as np
 from numpy.testing import assert_allclose
 import unittest
+import pickle
+from copy import deepcopy
 from unittest.mock import MagicMock
 from network import RNN
 from simulation import Simulation
@@ -199,6 +201,35 @@ class Test_UORO(unittest.TestCase):
 
         assert_allclose(rec_grads, correct_rec_grads)
 
+    def test_sample_nu(self):
+
+        samples = []
+        for _ in range(2):
+            np.random.seed(0)
+            self.learn_alg = UORO(self.rnn)
+            self.learn_alg.nu_batch_size = 3
+            samples.append([self.learn_alg.sample_nu() for _ in range(5)])
+
+        #Reproducible from np.random.seed, across batch refills
+        assert_allclose(samples[0], samples[1])
+        self.assertTrue(np.isin(samples[0], [-1, 1]).all())
+        self.assertEqual(np.array(samples[0]).shape, (5, 2))
+
+    def test_sample_nu_copies(self):
+
+        np.random.seed(0)
+        learn_alg = UORO(self.rnn)
+        learn_alg.nu_batch_size = 4
+        learn_alg.sample_nu()
+
+        #Copies and pickles leave out the batch but continue the samples
+        copies = [deepcopy(learn_alg),
+                  pickle.loads(pickle.dumps(learn_alg))]
+        samples = [learn_alg.sample_nu() for _ in range(6)]
+        for alg in copies:
+            self.assertNotIn('nu_batch', alg.__getstate__())
+            assert_allclose([alg.sample_nu() for _ in range(6)], samples)
+
 class Test_KF_RTRL(unittest.TestCase):
 
     @classmethod
@@ -8,6 +8,7 @@ Created on Tue Apr 30 11:29:15 2019
 
 import numpy as np
 import unittest
+import copy
 from network import *
 from numpy.testing import assert_allclose
 
@@ -84,6 +85,54 @@ class Test_Network(unittest.TestCase):
         #Compare with update from z_out
         self.assertTrue(np.isclose(self.rnn.z, z).all())
 
+    def test_run_forward(self):
+        """Verifies that run_forward matches stepping through next_state and
+        z_out one time step at a time."""
+
+        x_inputs = np.random.normal(0, 1, (20, self.rnn.n_in))
+
+        self.rnn.reset_network(h=np.ones(self.rnn.n_h))
+        A, Z = [], []
+        for x in x_inputs:
+            self.rnn.next_state(x)
+            self.rnn.z_out()
+            A.append(self.rnn.a)
+            Z.append(self.rnn.z)
+
+        self.rnn.reset_network(h=np.ones(self.rnn.n_h))
+        _, A_scan, Z_scan = self.rnn.run_forward(x_inputs)
+        assert_allclose(A_scan, np.array(A))
+        assert_allclose(Z_scan, np.array(Z))
+        assert_allclose(self.rnn.a, A[-1])
+
+    def test_float32(self):
+        """Verifies that a float32 network keeps its states in float32 and
+        agrees with the float64 network up to single precision."""
+
+        rnn_32 = RNN(self.rnn.W_in, self.rnn.W_rec, self.rnn.W_out,
+                     self.rnn.b_rec, self.rnn.b_out,
+                     activation=tanh,
+                     alpha=self.rnn.alpha,
+                     output=softmax,
+                     loss=softmax_cross_entropy,
+                     dtype=np.float32)
+        x_inputs = np.random.normal(0, 1, (20, self.rnn.n_in))
+
+        self.rnn.reset_network(h=np.ones(self.rnn.n_h))
+        rnn_32.reset_network(h=np.ones(self.rnn.n_h))
+        for x in x_inputs:
+            self.rnn.next_state(x)
+            rnn_32.next_state(x)
+        rnn_32.get_a_jacobian()
+        self.assertEqual(rnn_32.a.dtype, np.float32)
+        self.assertEqual(rnn_32.a_J.dtype, np.float32)
+        assert_allclose(rnn_32.a, self.rnn.a, rtol=1e-5)
+
+        rnn_32.reset_network(h=np.ones(self.rnn.n_h))
+        _, A_scan, _ = rnn_32.run_forward(x_inputs)
+        self.assertEqual(A_scan.dtype, np.float32)
+        assert_allclose(A_scan[-1], self.rnn.a, rtol=1e-5)
+
     def test_get_a_jacobian(self):
         """Verifies that get_a_jacobian produces correct output in a special
         case."""
@@ -93,6 +142,35 @@ class Test_Network(unittest.TestCase):
         J = np.diag([0.6*self.rnn.activation.f_prime(1) + 0.4]*self.rnn.n_h)
         self.assertTrue(np.isclose(J, self.rnn.a_J).all())
 
+    def test_get_D(self):
+        """Verifies that get_D is refreshed whenever h changes."""
+
+        self.rnn.reset_network(h=np.ones(self.rnn.n_h))
+        assert_allclose(self.rnn.get_D(), tanh_derivative(np.ones(8)))
+        self.rnn.next_state(x=np.zeros(self.rnn.n_in))
+        assert_allclose(self.rnn.get_D(), tanh_derivative(self.rnn.h))
+
+    def test_get_compiled_activation(self):
+        """Verifies that the compiled activation is cached, looked up again
+        when the activation changes, and left out of copies."""
+
+        rnn = RNN(self.rnn.W_in, self.rnn.W_rec, self.rnn.W_out,
+                  self.rnn.b_rec, self.rnn.b_out,
+                  activation=tanh,
+                  alpha=0.6,
+                  output=softmax,
+                  loss=softmax_cross_entropy)
+        self.assertIs(rnn.get_compiled_activation(),
+                      rnn.get_compiled_activation())
+        self.assertNotIn('compiled_activation', copy.copy(rnn).__dict__)
+
+        rnn.activation = sigmoid
+        rnn.reset_network(h=np.ones(rnn.n_h))
+        rnn.next_state(x=np.zeros(rnn.n_in))
+        assert_allclose(rnn.get_D(), sigmoid_derivative(rnn.h))
+        assert_allclose(rnn.a, 0.4 * sigmoid_(np.ones(rnn.n_h))
+                        + 0.6 * sigmoid_(rnn.h))
+
     def test_get_network_speed(self):
 
         self.rnn.reset_network(a=np.ones(self.rnn.n_h))
@@ -9,6 +9,7 @@ Created on Wed Jul 10 16:01:00 2019
 import unittest
 from optimizers import *
 import numpy as np
+from copy import deepcopy
 
 class Test_SGD(unittest.TestCase):
 
@@ -38,6 +39,20 @@ class Test_SGD(unittest.TestCase):
         self.assertTrue(np.isclose(updated_params,
                                    correct_updated_params).all())
 
+    def test_update_params(self):
+
+        for optimizer in [Stochastic_Gradient_Descent(lr=0.1),
+                          SGD_Momentum(lr=0.1, mu=0.5),
+                          Adam(lr=0.1)]:
+            optimizer_ = deepcopy(optimizer)
+            params = [np.ones(2), np.ones((2, 3))]
+            for _ in range(3):
+                grads = [np.random.normal(0, 1, p.shape) for p in params]
+                updated_params = optimizer.get_updated_params(params, grads)
+                optimizer_.update_params(params, grads)
+                for param, updated_param in zip(params, updated_params):
+                    self.assertTrue(np.isclose(param, updated_param).all())
+
     def test_lr_decay(self):
 
         optimizer = Stochastic_Gradient_Descent(lr=1, lr_decay_rate=0.9, min_lr=0.5)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import unittest
+from numpy.testing import assert_allclose
+from network import RNN
+from simulation import Simulation
+from learning_algorithms import RFLO
+from optimizers import Stochastic_Gradient_Descent
+from functions import *
+from rnn_kernels import *
+
+class Test_RNN_Kernels(unittest.TestCase):
+    """Tests kernels from the rnn_kernels.py module."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Initializes a simple dataset for testing."""
+
+        np.random.seed(0)
+
+        X = np.random.binomial(1, 0.5, (100, 2)).astype(float)
+        Y = np.roll(X, 2, axis=0)
+        cls.data = {'train': {'X': X, 'Y': Y}, 'test': {'X': X, 'Y': Y}}
+
+    def get_rnn(self, output, loss):
+        """Returns a fresh RNN with fixed random initial parameters."""
+
+        np.random.seed(1)
+        W_in  = np.random.normal(0, 1, (8, 2))
+        W_rec = np.random.normal(0, 0.3, (8, 8))
+        W_out = np.random.normal(0, 0.3, (2, 8))
+
+        return RNN(W_in, W_rec, W_out, np.zeros(8), np.zeros(2),
+                   activation=tanh, alpha=0.6, output=output, loss=loss)
+
+    def test_compiled_functions(self):
+        """Verifies that the compiled versions of functions.py match the
+        originals, and that functions without one are returned unchanged."""
+
+        z = np.random.normal(0, 2, 10)
+        y = np.random.uniform(0, 1, 10)
+        for func in [tanh_, tanh_derivative, sigmoid_, sigmoid_derivative,
+                     softmax_]:
+            assert_allclose(get_compiled_function(func)(z), func(z))
+        for func in [softmax_cross_entropy_, softmax_cross_entropy_derivative,
+                     mean_squared_error_]:
+            assert_allclose(get_compiled_function(func)(z, y), func(z, y))
+        for loss in [softmax_cross_entropy, mean_squared_error]:
+            f, f_prime = get_compiled_function(loss.f_and_f_prime)(z, y)
+            assert_allclose(f, loss.f(z, y))
+            assert_allclose(f_prime, loss.f_prime(z, y))
+            f, f_prime = loss.f_and_f_prime(z, y)
+            assert_allclose(f, loss.f(z, y))
+            assert_allclose(f_prime, loss.f_prime(z, y))
+        self.assertIs(get_compiled_function(relu_), relu_)
+
+    def test_get_codes(self):
+        """Verifies that supported and unsupported functions are reported
+        correctly."""
+
+        self.assertEqual(get_activation_code(tanh), 0)
+        self.assertIsNone(get_activation_code(relu))
+        self.assertEqual(get_loss_code(softmax, softmax_cross_entropy), 0)
+        self.assertIsNone(get_loss_code(identity, softmax_cross_entropy))
+
+    def test_rflo_sgd_scan(self):
+        """Verifies that rflo_sgd_scan reproduces training by Simulation with
+        RFLO and SGD for both supported losses."""
+
+        for output, loss in [(softmax, softmax_cross_entropy),
+                             (identity, mean_squared_error)]:
+
+            rnn = self.get_rnn(output, loss)
+            a = np.copy(rnn.a)
+            sim = Simulation(rnn)
+            sim.run(self.data,
+                    learn_alg=RFLO(rnn, alpha=0.5),
+                    optimizer=Stochastic_Gradient_Descent(lr=0.05),
+                    monitors=['rnn.loss_', 'rnn.a'],
+                    verbose=False, compiled=False)
+
+            rnn_ = self.get_rnn(output, loss)
+            params = [np.copy(p) for p in [rnn_.W_in, rnn_.W_rec, rnn_.b_rec,
+                                           rnn_.W_out, rnn_.b_out]]
+            B = np.zeros((8, 11))
+            _, A, _, _, L = rflo_sgd_scan(self.data['train']['X'],
+                                          self.data['train']['Y'],
+                                          a, *params, B, 0.6, 0.5, 0.05,
+                                          get_activation_code(tanh),
+                                          get_loss_code(output, loss))
+
+            assert_allclose(L, sim.mons['rnn.loss_'])
+            assert_allclose(A, sim.mons['rnn.a'])
+            assert_allclose(params[1], rnn.W_rec)
+            assert_allclose(params[3], rnn.W_out)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import unittest
+import pickle
+from operator import attrgetter
+from numpy.testing import assert_allclose
+from network import RNN
+from simulation import Simulation, DeltaCheckpointStore
+from learning_algorithms import RFLO
+from optimizers import Stochastic_Gradient_Descent
+from functions import *
+
+class Test_Simulation(unittest.TestCase):
+    """Tests methods from the simulation.py module."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Initializes a simple network and dataset for testing."""
+
+        np.random.seed(0)
+
+        n_in     = 2
+        n_hidden = 8
+        n_out    = 2
+
+        W_in  = np.random.normal(0, 1, (n_hidden, n_in))
+        W_rec = np.random.normal(0, 0.3, (n_hidden, n_hidden))
+        W_out = np.random.normal(0, 0.3, (n_out, n_hidden))
+
+        b_rec = np.zeros(n_hidden)
+        b_out = np.zeros(n_out)
+
+        cls.rnn = RNN(W_in, W_rec, W_out, b_rec, b_out,
+                      activation=tanh,
+                      alpha=0.6,
+                      output=softmax,
+                      loss=softmax_cross_entropy)
+
+        X = np.random.binomial(1, 0.5, (50, n_in)).astype(float)
+        Y = np.roll(X, 2, axis=0)
+        cls.data = {'train': {'X': X, 'Y': Y}, 'test': {'X': X, 'Y': Y}}
+
+    def test_monitors(self):
+        """Verifies that monitors record one value per time step, with the
+        right shapes, and that unfound attributes give empty arrays."""
+
+        self.rnn.reset_network(h=np.zeros(self.rnn.n_h))
+        a_initial = np.copy(self.rnn.a)
+        sim = Simulation(self.rnn)
+        sim.run(self.data, mode='test',
+                monitors=['rnn.a', 'rnn.loss_', 'rnn.W_rec-norm', 'rnn.foo'],
+                verbose=False,
+                a_initial=a_initial)
+
+        self.assertEqual(sim.mons['rnn.a'].shape, (50, self.rnn.n_h))
+        self.assertEqual(sim.mons['rnn.loss_'].shape, (50,))
+        self.assertEqual(sim.mons['rnn.W_rec-norm'].shape, (50,))
+        self.assertEqual(sim.mons['rnn.foo'].shape, (0,))
+
+        #Compare against stepping through the network manually
+        self.rnn.reset_network(a=a_initial)
+        for i_t in range(50):
+            self.rnn.next_state(self.data['test']['X'][i_t])
+        assert_allclose(sim.mons['rnn.a'][-1], self.rnn.a)
+
+    def test_train_monitors(self):
+        """Verifies that monitors of the learning algorithm are recorded
+        during training."""
+
+        rnn = RNN(self.rnn.W_in, self.rnn.W_rec, self.rnn.W_out,
+                  self.rnn.b_rec, self.rnn.b_out,
+                  activation=tanh,
+                  alpha=0.6,
+                  output=softmax,
+                  loss=softmax_cross_entropy)
+        sim = Simulation(rnn)
+        sim.run(self.data,
+                learn_alg=RFLO(rnn, alpha=0.6),
+                optimizer=Stochastic_Gradient_Descent(lr=0.01),
+                monitors=['learn_alg.rec_grads', 'rnn.loss_', 'rnn.params'],
+                verbose=False)
+
+        self.assertEqual(sim.mons['learn_alg.rec_grads'].shape,
+                         (50, rnn.n_h, rnn.n_h + rnn.n_in + 1))
+        self.assertEqual(sim.mons['rnn.loss_'].shape, (50,))
+
+        #Ragged values are kept as a list of copies
+        self.assertEqual(len(sim.mons['rnn.params']), 50)
+        for w_mon, w in zip(sim.mons['rnn.params'][-1], rnn.params):
+            assert_allclose(w_mon, w)
+        self.assertFalse(np.array_equal(sim.mons['rnn.params'][0][0],
+                                        rnn.W_rec))
+
+    def test_record_monitor(self):
+        """Verifies that monitor arrays are upcast for wider dtypes and fall
+        back to lists for values of a different shape."""
+
+        sim = Simulation(self.rnn)
+        sim.i_start, sim.i_end = 0, 4
+        sim.mons = {'a': None, 'b': None}
+        sim.n_mons = {'a': 0, 'b': 0}
+        for value in [1, 2.5, 3]:
+            sim.record_monitor('a', value)
+        for value in [np.zeros(2), np.ones(2), np.ones(3)]:
+            sim.record_monitor('b', value)
+        sim.monitors_to_arrays()
+
+        assert_allclose(sim.mons['a'], [1, 2.5, 3])
+        self.assertEqual(len(sim.mons['b']), 3)
+        assert_allclose(sim.mons['b'][1], np.ones(2))
+        assert_allclose(sim.mons['b'][2], np.ones(3))
+
+    def test_late_monitor(self):
+        """Verifies that attributes appearing after the first time step are
+        still monitored."""
+
+        sim = Simulation(self.rnn)
+        sim.i_start, sim.i_end = 0, 3
+        sim.mons = {'foo': None}
+        sim.n_mons = {'foo': 0}
+        sim.mon_getters = {'foo': attrgetter('foo')}
+        for sim.i_t in range(3):
+            sim.update_monitors()
+            sim.foo = sim.i_t
+        sim.monitors_to_arrays()
+
+        assert_allclose(sim.mons['foo'], [0, 1])
+
+    def test_copy_params(self):
+        """Verifies that training leaves arrays passed to the network
+        unchanged, while references held by the learning algorithm follow
+        the trained parameters."""
+
+        W_rec = np.copy(self.rnn.W_rec)
+        rnn = RNN(self.rnn.W_in, W_rec, self.rnn.W_out,
+                  self.rnn.b_rec, self.rnn.b_out,
+                  activation=tanh,
+                  alpha=0.6,
+                  output=softmax,
+                  loss=softmax_cross_entropy)
+        learn_alg = RFLO(rnn, alpha=0.6)
+        learn_alg.cached_W_rec = rnn.W_rec
+        sim = Simulation(rnn)
+        sim.run(self.data,
+                learn_alg=learn_alg,
+                optimizer=Stochastic_Gradient_Descent(lr=0.01),
+                compiled=False,
+                verbose=False)
+
+        assert_allclose(W_rec, self.rnn.W_rec)
+        self.assertFalse(np.array_equal(rnn.W_rec, W_rec))
+        self.assertIs(learn_alg.cached_W_rec, rnn.W_rec)
+
+    def test_compiled_run(self):
+        """Verifies that runs done by a compiled scan give the same monitors,
+        parameters and final state as the time loop."""
+
+        monitors = ['rnn.a', 'rnn.z', 'rnn.y_hat', 'rnn.loss_', 'rnn.error',
+                    'rnn.x']
+        for mode in ['test', 'train']:
+            sims = []
+            for compiled in [True, False]:
+                rnn = RNN(self.rnn.W_in, self.rnn.W_rec, self.rnn.W_out,
+                          self.rnn.b_rec, self.rnn.b_out,
+                          activation=tanh,
+                          alpha=0.6,
+                          output=softmax,
+                          loss=softmax_cross_entropy)
+                rnn.reset_network(h=np.zeros(rnn.n_h))
+                sim = Simulation(rnn)
+                sim.run(self.data, mode=mode,
+                        learn_alg=RFLO(rnn, alpha=0.5),
+                        optimizer=Stochastic_Gradient_Descent(lr=0.05),
+                        monitors=monitors,
+                        verbose=False,
+                        compiled=compiled)
+                sims.append(sim)
+
+            for key in monitors:
+                assert_allclose(sims[0].mons[key], sims[1].mons[key])
+            for w_0, w_1 in zip(sims[0].rnn.params, sims[1].rnn.params):
+                assert_allclose(w_0, w_1)
+            assert_allclose(sims[0].rnn.a, sims[1].rnn.a)
+            assert_allclose(sims[0].rnn.a_prev, sims[1].rnn.a_prev)
+            assert_allclose(sims[0].learn_alg.B, sims[1].learn_alg.B)
+
+        #Original parameters are left untouched by the compiled training
+        self.assertFalse(np.shares_memory(sims[0].rnn.W_rec, self.rnn.W_rec))
+
+    def test_save_best_model(self):
+        """Verifies that the best parameters are kept as copies, and that the
+        reused test simulation is not kept after the run."""
+
+        rnn = RNN(self.rnn.W_in, self.rnn.W_rec, self.rnn.W_out,
+                  self.rnn.b_rec, self.rnn.b_out,
+                  activation=tanh,
+                  alpha=0.6,
+                  output=softmax,
+                  loss=softmax_cross_entropy)
+        rnn.reset_network(h=np.zeros(rnn.n_h))
+        sim = Simulation(rnn)
+        sim.run(self.data,
+                learn_alg=RFLO(rnn, alpha=0.6),
+                optimizer=Stochastic_Gradient_Descent(lr=0.05),
+                best_model_interval=10,
+                verbose=False)
+
+        best_rnn = sim.get_best_rnn()
+        for w, w_best in zip(rnn.params, best_rnn.params):
+            self.assertFalse(np.shares_memory(w, w_best))
+        self.assertTrue(np.isfinite(sim.best_val_loss))
+        self.assertFalse(hasattr(sim, 'test_sim'))
+        for w_best, w in zip(sim.best_rnn.params, best_rnn.params):
+            assert_allclose(w_best, w)
+
+        #No best model saved yet, or kept by an older pickled simulation
+        self.assertIsNone(Simulation(rnn).best_rnn)
+        old_sim = Simulation(rnn)
+        old_sim.__dict__['best_rnn'] = best_rnn
+        self.assertIsInstance(pickle.loads(pickle.dumps(old_sim)).best_rnn,
+                              RNN)
+        self.assertIs(old_sim.get_best_rnn(), best_rnn)
+
+    def test_run_test(self):
+        """Verifies that run_test matches a test simulation from the current
+        state, for supported and unsupported output/loss pairs, and leaves
+        the network state unchanged."""
+
+        for output, loss in [(softmax, softmax_cross_entropy),
+                             (sigmoid, sigmoid_cross_entropy)]:
+            rnn = RNN(self.rnn.W_in, self.rnn.W_rec, self.rnn.W_out,
+                      self.rnn.b_rec, self.rnn.b_out,
+                      activation=tanh,
+                      alpha=0.6,
+                      output=output,
+                      loss=loss)
+            rnn.reset_network(h=np.zeros(rnn.n_h))
+            sim = Simulation(rnn)
+            a = np.copy(rnn.a)
+            Y_hat, L = sim.run_test(self.data)
+            assert_allclose(rnn.a, a)
+
+            test_sim = Simulation(rnn)
+            test_sim.run(self.data, mode='test',
+                         monitors=['rnn.y_hat', 'rnn.loss_'],
+                         verbose=False)
+            assert_allclose(Y_hat, test_sim.mons['rnn.y_hat'])
+            assert_allclose(L, test_sim.mons['rnn.loss_'])
+
+    def test_noise(self):
+        """Verifies that pre-drawn network noise has the right scale and is
+        reproducible with np.random.seed."""
+
+        noises = []
+        for _ in range(2):
+            np.random.seed(1)
+            self.rnn.reset_network(h=np.zeros(self.rnn.n_h))
+            sim = Simulation(self.rnn)
+            sim.run(self.data, mode='test', monitors=['rnn.noise'],
+                    sigma=0.5, verbose=False)
+            noises.append(sim.mons['rnn.noise'])
+
+        self.assertEqual(noises[0].shape, (50, self.rnn.n_h))
+        assert_allclose(noises[0], noises[1])
+        self.assertAlmostEqual(noises[0].std(), 0.5 * 0.6, delta=0.05)
+
+    def test_delta_checkpoint_store(self):
+        """Verifies that checkpoints stored as deltas are reconstructed
+        exactly, and that small changes are dropped when epsilon > 0."""
+
+        sims = []
+        for store in [None, DeltaCheckpointStore(base_interval=2)]:
+            rnn = RNN(self.rnn.W_in, self.rnn.W_rec, self.rnn.W_out,
+                      self.rnn.b_rec, self.rnn.b_out,
+                      activation=tanh,
+                      alpha=0.6,
+                      output=softmax,
+                      loss=softmax_cross_entropy)
+            rnn.reset_network(h=np.zeros(rnn.n_h))
+            sim = Simulation(rnn)
+            sim.run(self.data,
+                    learn_alg=RFLO(rnn, alpha=0.6, B=np.zeros((8, 11))),
+                    optimizer=Stochastic_Gradient_Descent(lr=0.01),
+                    checkpoint_interval=10,
+                    checkpoint_store=store,
+                    verbose=False)
+            sims.append(sim)
+
+        self.assertIsInstance(sims[1].checkpoints, DeltaCheckpointStore)
+        self.assertEqual(sorted(sims[0].checkpoints.keys()),
+                         sorted(sims[1].checkpoints.keys()))
+        for i_t in sims[0].checkpoints:
+            rnn_0 = sims[0].checkpoints[i_t]['rnn']
+            checkpoint = sims[1].checkpoints[i_t]
+            rnn_1 = checkpoint['rnn']
+            for w_0, w_1 in zip(rnn_0.params, rnn_1.params):
+                self.assertTrue((w_0 == w_1).all())
+            self.assertIs(rnn_1.W_rec, rnn_1.params[0])
+            self.assertIs(checkpoint['learn_alg'].rnn, rnn_1)
+            assert_allclose(rnn_1.a, rnn_0.a)
+
+        #Every parameter changes under SGD, yet the store is no larger
+        dense_size = len(pickle.dumps(dict(sims[0].checkpoints)))
+        delta_size = len(pickle.dumps(sims[1].checkpoints))
+        self.assertLessEqual(delta_size, dense_size)
+
+        store = DeltaCheckpointStore(base_interval=10, epsilon=1)
+        for i_t in sims[0].checkpoints:
+            store[i_t] = sims[0].checkpoints[i_t]
+        assert_allclose(store[49]['rnn'].W_rec,
+                        sims[0].checkpoints[0]['rnn'].W_rec)
+
+if __name__ == '__main__':
+    unittest.main()
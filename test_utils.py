@@ -8,6 +8,9 @@ Created on Mon Apr 29 15:33:06 2019
 
 import numpy as np
 import unittest
+import os
+import pickle
+import tempfile
 from utils import *
 
 class Test_Utils(unittest.TestCase):
@@ -35,6 +38,16 @@ class Test_Utils(unittest.TestCase):
         self.assertTrue(x_list[1].shape == (3,2))
         self.assertTrue(x_list[2].shape == (4,2))
 
+        #Axes of length 1 are squeezed out of the views
+        x = np.arange(10.0).reshape((2, 5))
+        x_list = split_weight_matrix(x, [3, 1, 1], axis=1)
+        self.assertTrue(x_list[1].shape == (2,))
+        self.assertTrue(np.shares_memory(x_list[0], x))
+        x_list = split_weight_matrix(x[:1], [3, 1, 1], axis=1)
+        self.assertTrue(x_list[0].shape == (3,))
+        self.assertTrue(x_list[2].shape == ())
+        self.assertEqual(x_list[2], 4)
+
     def test_rectangular_filter(self):
         """Verifies that the rectangular convolution returns 0s for a simple
         sequence of alternating 1s and -1s with filter_size 2."""
@@ -42,9 +55,39 @@ class Test_Utils(unittest.TestCase):
         x = np.array([1, -1]*10)
         self.assertTrue((rectangular_filter(x, filter_size=2) == 0).all())
 
+    def test_moving_average(self):
+        """Verifies that moving_average matches a direct average over each
+        window."""
+
+        x = np.random.normal(0, 1, 100)
+        x_avg = moving_average(x, 7)
+        self.assertEqual(x_avg.shape, (94,))
+        self.assertTrue(np.allclose(x_avg, [x[i:i + 7].mean()
+                                            for i in range(94)]))
+
     def test_classification_accuracy(self):
         """Verifies that """
 
+    def test_save_and_load_pickle(self):
+        """Verifies that save_pickle (synchronous and asynchronous) and
+        load_pickle round trip with and without compression, and that
+        load_pickle reads plain pickles."""
+
+        obj = {'mons': np.random.normal(0, 1, (100, 8)), 'config': 'RFLO'}
+        with tempfile.TemporaryDirectory() as save_dir:
+            save_path = os.path.join(save_dir, 'result_0')
+            for compress in [True, False]:
+                save_pickle(obj, save_path, compress=compress)
+                loaded = load_pickle(save_path)
+                self.assertTrue((loaded['mons'] == obj['mons']).all())
+                self.assertEqual(loaded['config'], 'RFLO')
+            save_pickle_async(obj, save_path).result()
+            self.assertTrue((load_pickle(save_path)['mons'] ==
+                             obj['mons']).all())
+            with open(save_path, 'wb') as f:
+                pickle.dump(obj, f)
+            self.assertEqual(load_pickle(save_path)['config'], 'RFLO')
+
     def test_regetattr(self):
         """Verifies regetattr in a simple nested object case."""
 
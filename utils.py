@@ -11,16 +11,28 @@ import numpy as np
 import itertools
 from scipy.stats import unitary_group
 from scipy.signal import decimate
-from functools import reduce
+from functools import reduce, lru_cache
 from pdb import set_trace
 from scipy.ndimage.filters import uniform_filter1d
+import pickle
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import zstandard as zstd
+except ModuleNotFoundError:
+    zstd = None
+
+#First bytes of every zstd frame, used to detect compressed files on loading
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
 
 ### --- Mathematical tools --- ###
 
 def norm(z):
     """Computes the L2 norm of a numpy array."""
 
-    return np.sqrt(np.sum(np.square(z)))
+    #Flatten in memory order (a view for any contiguous array), so that
+    #np.linalg.norm takes its single-pass BLAS route
+    return np.linalg.norm(np.ravel(z, order='K'))
 
 def clip_norm(z, max_norm=1.0):
     """Clips the norm of an array"""
@@ -32,15 +44,33 @@ def clip_norm(z, max_norm=1.0):
 
 def split_weight_matrix(A, sizes, axis=1):
     """Splits a weight matrix along the specified axis (0 for row, 1 for
-    column) into a list of sub arrays of size specified by 'sizes'."""
-
-    idx = [0] + np.cumsum(sizes).tolist()
+    column) into a list of sub arrays of size specified by 'sizes'. The sub
+    arrays are views of A, with axes of length 1 squeezed out."""
+
+    slices = get_split_slices(tuple(sizes))
+    if A.shape[1 - axis] == 1:
+        #The other axis must be squeezed too, which plain indexing does not do
+        if axis == 1:
+            return [np.squeeze(A[:, s]) for s in slices]
+        elif axis == 0:
+            return [np.squeeze(A[s]) for s in slices]
     if axis == 1:
-        ret = [np.squeeze(A[:,idx[i]:idx[i+1]]) for i in range(len(idx) - 1)]
+        ret = [A[:, s] for s in slices]
     elif axis == 0:
-        ret = [np.squeeze(A[idx[i]:idx[i+1],:]) for i in range(len(idx) - 1)]
+        ret = [A[s] for s in slices]
     return ret
 
+@lru_cache(maxsize=None)
+def get_split_slices(sizes):
+    """Returns the list of indices splitting an axis into consecutive pieces
+    of the given sizes, computed once per tuple of sizes (split_weight_matrix
+    is called with the same sizes at every time step). Pieces of size 1 get
+    an integer index, which drops that axis as np.squeeze would."""
+
+    idx = [0] + np.cumsum(sizes).tolist()
+    return [idx[i] if sizes[i] == 1 else slice(idx[i], idx[i+1])
+            for i in range(len(sizes))]
+
 def rectangular_filter(signal, filter_size=100):
     """Convolves a given signal with a rectangular filter in 'valid' mode
 
@@ -49,7 +79,21 @@ def rectangular_filter(signal, filter_size=100):
         filter_size (int): An integer specifcying the width of the rectangular
             filter used for the convolution."""
 
-    return np.convolve(signal, np.ones(filter_size)/filter_size, mode='valid')
+    return moving_average(signal, filter_size)
+
+def moving_average(x, w):
+    """Computes the average of x over every window of w consecutive entries
+    (equivalent to a rectangular filter in 'valid' mode), in O(len(x)) time
+    from differences of a cumulative sum, regardless of w.
+
+    Args:
+        x (numpy array): A 1-dimensional array to be averaged.
+        w (int): The width of the averaging window.
+    Returns:
+        A numpy array of shape (len(x) - w + 1) of window averages."""
+
+    c = np.concatenate([[0.0], np.cumsum(x)])
+    return (c[w:] - c[:-w]) / w
 
 def classification_accuracy(data, y_hat):
     """Calculates the fraction of test data whose argmax matches that of
@@ -129,6 +173,11 @@ def weighted_median(hist, bin_centers):
     hist_cdf = np.cumsum(hist)/hist.sum()
     return bin_centers[np.where(hist_cdf >= 0.5)[0][0]]
 
+def first_multiple(i, n):
+    """Returns the smallest multiple of the integer n that is >= i."""
+
+    return -(-i//n)*n
+
 ### --- Plotting tools --- ###
 
 def plot_eigenvalues(*matrices, fig=None, return_fig=False):
@@ -270,3 +319,69 @@ def rgetattr(obj, attr):
         The attribute of obj referred to."""
 
     return reduce(getattr, [obj] + attr.split('.'))
+
+### --- Saving and loading --- ###
+
+def save_pickle(obj, save_path, compress=True):
+    """Pickles obj to save_path with the highest pickle protocol, whose
+    binary framing writes numpy arrays (e.g. sim.mons) as raw buffers.
+
+    Args:
+        obj (object): Any picklable object, e.g. a Simulation or result dict.
+        save_path (str): Path of the file to write.
+        compress (bool): Whether to stream the pickle through a zstd
+            compressor. Ignored if the zstandard package is not installed."""
+
+    with open(save_path, 'wb') as f:
+        if compress and zstd is not None:
+            cctx = zstd.ZstdCompressor(level=3, threads=-1)
+            with cctx.stream_writer(f, closefd=False) as writer:
+                pickle.dump(obj, writer, protocol=pickle.HIGHEST_PROTOCOL)
+        else:
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+#Single background thread shared by all calls to save_pickle_async
+save_executor = None
+
+def save_pickle_async(obj, save_path, compress=True):
+    """Runs save_pickle in a background thread, so that computation can
+    continue while the file is written. Saves run one at a time in the order
+    they were submitted, and all pending saves are completed before the
+    interpreter exits.
+
+    obj must not be modified after calling this function, since it is
+    pickled at some later point (pass a deepcopy if needed).
+
+    Args:
+        obj (object): Any picklable object, e.g. a Simulation or result dict.
+        save_path (str): Path of the file to write.
+        compress (bool): See save_pickle.
+    Returns:
+        A concurrent.futures.Future whose result() blocks until the file is
+            written (and raises any exception from writing it)."""
+
+    global save_executor
+    if save_executor is None:
+        save_executor = ThreadPoolExecutor(max_workers=1)
+        atexit.register(save_executor.shutdown, wait=True)
+
+    return save_executor.submit(save_pickle, obj, save_path, compress)
+
+def load_pickle(save_path):
+    """Loads a file written by save_pickle, or by a plain pickle.dump.
+
+    Args:
+        save_path (str): Path of the file to read.
+    Returns:
+        The unpickled object."""
+
+    with open(save_path, 'rb') as f:
+        if f.read(4) == ZSTD_MAGIC:
+            f.seek(0)
+            if zstd is None:
+                raise ModuleNotFoundError('zstandard is required to load '
+                                          + save_path)
+            with zstd.ZstdDecompressor().stream_reader(f) as reader:
+                return pickle.load(reader)
+        f.seek(0)
+        return pickle.load(f)